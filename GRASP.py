@@ -1,17 +1,100 @@
 import random, time
 import sys
-from typing import List
+from collections import Counter
+from typing import List, Tuple
 from generator import Generator
 from greedy_solver import GreedySolver
-from global_functions import calculate_penalty
+from global_functions import calculate_penalty, make_rng
+from profiling import PhaseProfiler, cprofile_export
+from candidates import CandidatePool
+from bounds import lower_bound_leftovers, optimality_gap
 import matplotlib.pyplot as plt
 
-random.seed(time.time())
+def insort_descending(values: list, x) -> None:
+    '''Insert x into list sorted descending after equal elements, like `bisect.insort` with key (which needs Python 3.10)'''
+    lo, hi = 0, len(values)
+    while lo < hi:
+        mid = (lo + hi) // 2
+        if values[mid] >= x:
+            lo = mid + 1
+        else:
+            hi = mid
+    values.insert(lo, x)
+
+class ReactiveChoice:
+    '''Reactive GRASP choice of one parameter. Values are drawn with probabilities proportional to the improvement per greedy call they produced.'''
+
+    def __init__(self, values: list, rng: random.Random, min_probability: float = 0.05) -> None:
+        self.values = list(values)
+        self.rng = rng
+        self.min_probability = min(min_probability, 1 / len(self.values))
+        self.gain = [0.0] * len(self.values)
+        self.cost = [0] * len(self.values)
+        self.probabilities = [1 / len(self.values)] * len(self.values)
+
+    def choose(self) -> int:
+        '''Draw index of a value'''
+        return self.rng.choices(range(len(self.values)), weights=self.probabilities)[0]
+
+    def record(self, idx: int, gain: float, cost: int) -> None:
+        self.gain[idx] += gain
+        self.cost[idx] += cost
+
+    def update(self) -> None:
+        '''Recompute probabilities from gathered efficiency. Every value keeps at least `min_probability` so that it can still be re-evaluated'''
+        efficiency = [g / max(1, c) for g, c in zip(self.gain, self.cost)]
+        total = sum(efficiency)
+        if total <= 0:
+            return
+        free = 1 - self.min_probability * len(self.values)
+        self.probabilities = [self.min_probability + free * e / total for e in efficiency]
+
+    def get_dict(self) -> dict:
+        return {str(v): p for v, p in zip(self.values, self.probabilities)}
+
+
+class ElitePool:
+    '''Pool of diverse high quality solutions. Solutions are deduplicated by hash of their set composition.'''
+
+    def __init__(self, size: int) -> None:
+        self.size = size
+        self.entries = list()
+        self.keys = set()
+
+    @staticmethod
+    def composition(solution: List[List[int]]) -> Tuple[Tuple[int, ...], ...]:
+        '''Order independent composition of solution sets'''
+        return tuple(sorted([tuple(sorted(s)) for s in solution]))
+
+    def add(self, score: float, solution: List[List[int]], leftovers: List[int]) -> bool:
+        '''Add copy of solution unless it is already stored or worse than every stored one in a full pool. Return whether it was added'''
+        key = hash(ElitePool.composition(solution))
+        if key in self.keys:
+            return False
+        if len(self.entries) >= self.size:
+            worst = max(range(len(self.entries)), key=lambda i: self.entries[i][0])
+            if self.entries[worst][0] <= score:
+                return False
+            self.keys.discard(self.entries[worst][1])
+            del self.entries[worst]
+
+        self.entries.append((score, key, [list(s) for s in solution], list(leftovers)))
+        self.keys.add(key)
+        return True
+
+    def choose_guide(self, rng: random.Random, solution: List[List[int]]) -> List[List[int]]:
+        '''Return sets of random stored solution that differs from `solution`, None if there is none'''
+        key = hash(ElitePool.composition(solution))
+        guides = [entry for entry in self.entries if entry[1] != key]
+        if len(guides) == 0:
+            return None
+        return rng.choice(guides)[2]
+
 
 class GRASP:
     '''GRASP approach implementation.'''
 
-    def __init__(self, verbose: bool = False, problem: list = None, T: int = None, RCL_count: int = 20, dropout_rate: float = 0.5) -> None:
+    def __init__(self, verbose: bool = False, problem: list = None, T: int = None, RCL_count: int = 20, dropout_rate: float = 0.5, rng: random.Random = None, profile_path: str = None, candidate_k: int = 0, early_stop: bool = True, histogram: bool = False, reactive: bool = False, reactive_period: int = 10, reactive_choices: dict = None, elite_size: int = 0, relink_rate: float = 0.3, memo_size: int = 64, reach: int = None) -> None:
         '''
         Create GRASP base.  
         Params:  
@@ -20,9 +103,22 @@ class GRASP:
             `T`: number to which all the sets should sum up. If not provided then default value is 250   
             `RCL_count`: used to determine how many candidate searches should algorithm perform in each iteration  
             `dropout_rate`: rate of random set dropout performed at the and of each iteration. At rate of (1-dropout_rate) dropout will be based on greedy approach    
+            `rng`: random number generator or seed. Shared with the greedy solver and the problem generator  
+            `profile_path`: if provided, every `perform_GRASP` run is profiled with cProfile and stats are dumped to this path  
+            `candidate_k`: maximal size (2-4) of T-subsets found by hash joins in the candidate pool and put into RCL before greedy searches. 0 disables the pool  
+            `early_stop`: flag to indicate whether search should stop as soon as the best solution meets the lower bound on leftovers  
+            `histogram`: flag to indicate whether greedy searches should run on value -> count histogram of leftovers, see `GreedySolver.greedy_histogram_groups`  
+            `reactive`: flag to indicate whether RCL_count and dropout_rate of every iteration should be drawn from `reactive_choices`, favouring values that produced improvements with fewer greedy calls  
+            `reactive_period`: number of iterations between updates of reactive probabilities  
+            `reactive_choices`: dict with lists of 'RCL_count' and 'dropout_rate' values. By default RCL_count, RCL_count/4, RCL_count/16 and dropout rates 0.2, 0.5, 0.8  
+            `elite_size`: number of distinct good solutions kept in elite pool for path relinking. 0 disables the pool  
+            `relink_rate`: probability of path relinking from current solution towards random elite solution after each iteration  
+            `memo_size`: number of leftover states whose deterministic ('desc') greedy result is memoized. 0 disables memoization  
+            `reach`: optional precomputed `bounds.reachable_sums` of the problem (or of a superset of it) for any bound >= T, used by the lower bound  
         '''
-        self.greedySolver = GreedySolver(verbose=False)
-        self.generator = Generator()
+        self.rng = make_rng(rng)
+        self.greedySolver = GreedySolver(verbose=False, rng=self.rng)
+        self.generator = Generator(self.rng)
         self.verbose = verbose
         self.RCLs_count = RCL_count
         self.score = 2e9
@@ -30,6 +126,32 @@ class GRASP:
         self.score_history = list()
         self.best_achieved_score = 2e9
         self.best_achieved_solution = list()
+        self.best_achieved_leftovers = list()
+        self.iterations = 0
+        self.run_time = 0
+        self.profile_path = profile_path
+        self.profiler = PhaseProfiler(evaluation_phase='evaluation')
+        self.candidate_k = candidate_k
+        self.candidate_pool = None
+        self.dropped_sets = set()
+        self.pool_wins = 0
+        self.early_stop = early_stop
+        self.histogram = histogram
+        self.greedy_calls = 0
+        self.memo_size = memo_size
+        self.greedy_memo = dict()
+        self.memo_hits = 0
+        self.iteration_RCL_count = RCL_count
+        self.iteration_dropout_rate = dropout_rate
+        self.reactive = reactive
+        self.reactive_period = reactive_period
+        self.elite_pool = ElitePool(elite_size) if elite_size > 0 else None
+        self.relink_rate = relink_rate
+        self.relinks = 0
+        self.relink_improvements = 0
+        self.lower_bound = 0
+        self.reach = reach
+        self.iterations_performed = 0
 
         if problem != None:
             self.problem = problem
@@ -41,14 +163,25 @@ class GRASP:
         else:
             self.T = 9000
 
+        if reactive:
+            choices = reactive_choices if reactive_choices != None else dict()
+            self.reactive_RCL = ReactiveChoice(choices.get('RCL_count', sorted({max(1, RCL_count // 16), max(1, RCL_count // 4), RCL_count})), self.rng)
+            self.reactive_dropout = ReactiveChoice(choices.get('dropout_rate', [0.2, 0.5, 0.8]), self.rng)
+
         
 
     def find_base_solution(self) -> None:
         '''Find base greedy solution as a baseline'''
-        s, l, p = self.greedySolver.greedy_solution(self.problem, self.T, 'desc')
+        if self.histogram:
+            s, l, p = self.greedySolver.greedy_histogram_solution(Counter(self.problem), self.T, 'desc')
+        else:
+            s, l, p = self.greedySolver.greedy_solution(self.problem, self.T, 'desc')
         self.solution = s
         self.penalty = p
-        self.leftovers = l
+        #Leftovers are kept sorted descending, so 'desc' greedy sorts them in linear time
+        self.leftovers = sorted(l, reverse=True)
+        if self.candidate_k > 0:
+            self.candidate_pool = CandidatePool(self.T, self.leftovers, max_k=self.candidate_k)
         self.evaluate_Solution()
         self.base_solution_quality = self.score
 
@@ -60,49 +193,215 @@ class GRASP:
         Params:  
             `iterations`: number of GRASP search iterations
         '''
-        self.find_base_solution()
-        self.score_history.append(self.score)
-
-        for i in range(iterations):
-            self.i = i
-            self.solution_dropout()
-            self.create_RCL()
-            self.perform_selection()
-            self.evaluate_Solution()
+        start_time = time.perf_counter_ns()
+        self.iterations = iterations
+
+        with cprofile_export(self.profile_path), self.profiler.run():
+            t = self.profiler.start()
+            self.lower_bound = lower_bound_leftovers(self.problem, self.T, reach=self.reach)
+            t = self.profiler.stop('lower_bound', t, len(self.problem))
+            self.find_base_solution()
             self.score_history.append(self.score)
+            self.store_best_solution()
+            self.profiler.stop('base_solution', t, len(self.problem))
+
+            for i in range(iterations):
+                #Best solution is provably optimal, nothing to improve
+                if self.early_stop and len(self.best_achieved_leftovers) <= self.lower_bound:
+                    self.debug_message(f'Lower bound of {self.lower_bound} leftovers reached in iteration {i}')
+                    break
+
+                self.i = i
+                self.iterations_performed = i + 1
+                if self.reactive:
+                    rcl_idx, dropout_idx = self.reactive_RCL.choose(), self.reactive_dropout.choose()
+                    self.iteration_RCL_count = self.reactive_RCL.values[rcl_idx]
+                    self.iteration_dropout_rate = self.reactive_dropout.values[dropout_idx]
+                    previous_score, previous_calls = self.score, self.greedy_calls
+                t = self.profiler.start()
+                self.solution_dropout()
+                t = self.profiler.stop('dropout', t, len(self.solution))
+                self.create_RCL()
+                t = self.profiler.stop('create_RCL', t, len(self.leftovers) * self.iteration_RCL_count)
+                self.perform_selection()
+                t = self.profiler.stop('selection', t, len(self.best_candidates))
+                self.evaluate_Solution()
+                self.score_history.append(self.score)
+
+                if self.reactive:
+                    self.__reward_choices(rcl_idx, dropout_idx, previous_score, previous_calls)
+
+                if self.best_achieved_score > self.score:
+                    self.store_best_solution()
+                t = self.profiler.stop('evaluation', t, len(self.problem))
+
+                if self.elite_pool != None:
+                    self.elite_pool.add(self.score, self.solution, self.leftovers)
+                    if self.rng.random() < self.relink_rate:
+                        self.path_relinking()
+                        if self.best_achieved_score > self.score:
+                            self.store_best_solution()
+                    self.profiler.stop('path_relinking', t, len(self.problem))
+
+        self.run_time = time.perf_counter_ns() - start_time
+        self.debug_message(f'Best found solution has score of {min(self.score_history)}')
 
-            if self.best_achieved_score > self.score:
-                self.best_achieved_score = self.score
-                self.best_achieved_solution = self.solution
+    def __reward_choices(self, rcl_idx: int, dropout_idx: int, previous_score: float, previous_calls: int) -> None:
+        '''Credit chosen parameter values with improvement of the iteration (in leftover elements), new best solution counts double'''
+        gain = max(0.0, previous_score - self.score) * len(self.problem)
+        if self.score < self.best_achieved_score:
+            gain *= 2
+        cost = self.greedy_calls - previous_calls
+        self.reactive_RCL.record(rcl_idx, gain, cost)
+        self.reactive_dropout.record(dropout_idx, gain, cost)
+
+        if self.iterations_performed % self.reactive_period == 0:
+            self.reactive_RCL.update()
+            self.reactive_dropout.update()
+
+    def path_relinking(self) -> None:
+        '''Move from current solution towards random elite solution. Sets shared by both are kept, sets of the guide are introduced one by one,
+        current sets in their way are dissolved and leftovers are repaired greedily after every step. Best solution on the path replaces current one if it is better'''
+        guide = self.elite_pool.choose_guide(self.rng, self.solution)
+        if guide == None:
+            return
+        self.relinks += 1
+
+        guide_sets = Counter([tuple(sorted(s)) for s in guide])
+        sets = [tuple(sorted(s)) for s in self.solution]
+        missing = list((guide_sets - Counter(sets)).elements())
+        self.rng.shuffle(missing)
+        free = Counter(self.leftovers)
+        best_leftovers = sum(free.values())
+        best_path = None
+
+        current = Counter(sets)
+
+        for g in missing:
+            #Dissolve current sets that are not part of the guide until values of g are free
+            need = Counter(g) - free
+            for idx in range(len(sets) - 1, -1, -1):
+                if len(need) == 0:
+                    break
+                s = sets[idx]
+                if current[s] > guide_sets[s] and any(need[el] > 0 for el in s):
+                    free.update(s)
+                    need = Counter(g) - free
+                    current[s] -= 1
+                    sets[idx] = sets[-1]
+                    sets.pop()
+            if len(need) > 0:
+                continue
+
+            free.subtract(g)
+            sets.append(g)
+            current[g] += 1
+
+            #Greedy repair of freed elements
+            repaired, _, _ = self.greedySolver.greedy_histogram_solution(+free, self.T, 'desc')
+            self.greedy_calls += 1
+            for s in repaired:
+                free.subtract(s)
+                sets.append(tuple(sorted(s)))
+                current[sets[-1]] += 1
+            free = +free
+
+            if sum(free.values()) < best_leftovers:
+                best_leftovers = sum(free.values())
+                best_path = ([list(s) for s in sets], list(free.elements()))
+
+        if best_path != None:
+            self.relink_improvements += 1
+            self.solution, self.leftovers = best_path[0], sorted(best_path[1], reverse=True)
+            self.evaluate_Solution()
+            if self.candidate_pool != None:
+                self.candidate_pool = CandidatePool(self.T, self.leftovers, max_k=self.candidate_k)
 
-        self.debug_message(f'Best found solution has score of {min(self.score_history)}')
+    def store_best_solution(self) -> None:
+        '''Save copy of current solution as the best achieved one'''
+        self.best_achieved_score = self.score
+        self.best_achieved_solution = [list(s) for s in self.solution]
+        self.best_achieved_leftovers = list(self.leftovers)
 
     def create_RCL(self):
-        '''Create Restricted Candidate List based on n random greedy searches'''
+        '''Create Restricted Candidate List based on n random greedy searches.
+        With candidate pool, its small T-subsets together with greedy searches on the rest of leftovers form another candidate,
+        which competes on leftovers with the plain greedy candidate, only a fraction of greedy searches is run for each of them'''
+        greedy_runs = self.iteration_RCL_count
+        seeded = None
+
+        if self.candidate_pool != None:
+            greedy_runs = max(1, self.iteration_RCL_count // 10)
+            #Sets dropped in this iteration are tabu, otherwise the pool would put them straight back and undo the dropout
+            pool_sets = self.candidate_pool.extract(tabu=self.dropped_sets)
+            if len(pool_sets) > 0:
+                remaining = Counter(self.leftovers)
+                for s in pool_sets:
+                    remaining.subtract(s)
+                sets, leftover_count = self.__best_greedy(sorted(remaining.elements(), reverse=True), greedy_runs)
+                seeded = (leftover_count, pool_sets + sets)
+
+        best_candidates, leftover_count = self.__best_greedy(self.leftovers, greedy_runs)
+        if seeded != None and seeded[0] < leftover_count:
+            best_candidates = seeded[1]
+            self.profiler.count('pool_wins')
+            self.pool_wins += 1
+        self.best_candidates = best_candidates
+
+    def __best_greedy(self, leftovers: list, greedy_runs: int) -> Tuple[List[List[int]], int]:
+        '''Perform greedy search on leftovers `greedy_runs` times, return explicit sets of the candidate with lowest penalty and its number of leftovers'''
         best_candidates = None
         best_penalty = 2e9
+        histogram = Counter(leftovers) if self.histogram else None
+        state = None
 
-
-        #Perform greedy search N times, save only candidate with lowest penalty
-        for _ in range(self.RCLs_count):
-            if(random.random() < 0.2):
-                approach = 'random'
+        for _ in range(greedy_runs):
+            if(self.rng.random() < 0.2):
+                approach = 'rand'
             else:
                 approach = 'desc'
-            sets, _, pen = self.greedySolver.greedy_solution(self.leftovers, self.T, approach)
+
+            #Deterministic runs depend only on the leftover multiset, repeated states are served from memo
+            if approach == 'desc' and self.memo_size > 0:
+                if state == None:
+                    state = frozenset((histogram if histogram != None else Counter(leftovers)).items())
+                if state in self.greedy_memo:
+                    sets, pen = self.greedy_memo[state]
+                    self.profiler.count('greedy_memo_hits')
+                    self.memo_hits += 1
+                else:
+                    sets, pen = self.__run_greedy(leftovers, histogram, approach)
+                    if len(self.greedy_memo) >= self.memo_size:
+                        del self.greedy_memo[next(iter(self.greedy_memo))]
+                    self.greedy_memo[state] = (sets, pen)
+            else:
+                sets, pen = self.__run_greedy(leftovers, histogram, approach)
 
             if pen < best_penalty:
-                best_penalty = pen 
+                best_penalty = pen
                 best_candidates = sets
 
-        self.best_candidates = best_candidates
+        #Only the winning candidate is expanded (or copied out of memo) to explicit sets
+        if self.histogram:
+            best_candidates = [s for group in best_candidates for s in group.expand()]
+        else:
+            best_candidates = [list(s) for s in best_candidates]
+        return best_candidates, round(best_penalty * len(leftovers))
 
-        if best_candidates == None:
-            self.debug_message('Create RCL: No best candidates found')
+    def __run_greedy(self, leftovers: list, histogram: Counter, approach: str) -> Tuple[list, float]:
+        '''Run single greedy search on leftovers (or their histogram), return found T-sets (or groups of them) and penalty'''
+        if histogram != None:
+            sets, _, pen = self.greedySolver.greedy_histogram_groups(histogram, self.T, approach)
+        else:
+            sets, _, pen = self.greedySolver.greedy_solution(leftovers, self.T, approach)
+        self.profiler.count('greedy_calls')
+        self.greedy_calls += 1
+        return sets, pen
 
     def perform_selection(self):
         '''Perform selection over list of best candidates'''
         best_candidate = None
+        removed = Counter()
         
         #add best candidates to solution
         for candidate in self.best_candidates:
@@ -112,8 +411,23 @@ class GRASP:
             self.solution.append(candidate)
 
             #Remove elements from lefotvers that are memebers of added set 
-            for c in candidate:
-                self.leftovers.remove(c)
+            if self.histogram:
+                removed.update(candidate)
+            else:
+                for c in candidate:
+                    self.leftovers.remove(c)
+            if self.candidate_pool != None:
+                self.candidate_pool.remove(candidate)
+
+        #Histogram mode rebuilds leftovers in a single pass instead of a linear remove per element
+        if self.histogram and len(removed) > 0:
+            leftovers = list()
+            for el in self.leftovers:
+                if removed[el] > 0:
+                    removed[el] -= 1
+                else:
+                    leftovers.append(el)
+            self.leftovers = leftovers
 
         # if best_candidate != None:
         #     self.solution.append(best_candidate)
@@ -135,15 +449,16 @@ class GRASP:
         Selection in `dropout_rate` cases is based on the random choice, other times the longest set is chosen to be dropped.
         '''
         remove_index = list()
+        self.dropped_sets.clear()
         dropout_items_cnt =1 #max(int(0.3 * len(self.solution)), 0)
 
         #Remove least promising (or randomly chosen with %chance) set from solution
-        if random.random() < self.dropout_rate:
+        if self.rng.random() < self.iteration_dropout_rate:
             items = len(self.solution)
             if items == 0:
                 self.debug_message(f'{self.i}, {self.solution}')
                 return
-            remove_index.append(random.randint(0, items-1))
+            remove_index.append(self.rng.randint(0, items-1))
             
         #Remove constraint based, weakest element in solution
         else:
@@ -163,7 +478,7 @@ class GRASP:
 
                 if longest_idx != None:
                     remove_index.append(longest_idx)
-                if shortest_idx != None:
+                if shortest_idx != None and shortest_idx != longest_idx:
                     remove_index.append(shortest_idx)
         
         if len(remove_index) == 0:
@@ -175,7 +490,10 @@ class GRASP:
 
             #Add removed set to leftovers 
             for m in set_to_remove:
-                self.leftovers.append(m)
+                insort_descending(self.leftovers, m)
+            if self.candidate_pool != None:
+                self.candidate_pool.add(set_to_remove)
+            self.dropped_sets.add(tuple(sorted(set_to_remove)))
 
             #Remove set from solution
             #self.solution[0:remov_idx] + self.solution[remov_idx+1:]
@@ -211,6 +529,48 @@ class GRASP:
     def get_best_achieved_score(self) -> float:
         return self.best_achieved_score
 
+    def get_optimality_gap(self) -> float:
+        '''Difference between score of the best solution and the lower bound on score'''
+        return optimality_gap(len(self.best_achieved_leftovers), self.lower_bound, len(self.problem))
+
+    def get_best_achieved_solution(self) -> List[List[int]]:
+        return self.best_achieved_solution
+
+    def get_best_achieved_leftovers(self) -> List[int]:
+        return self.best_achieved_leftovers
+
+    def get_result_dict(self) -> dict:
+        return {
+            'problem': self.problem,
+            'T': self.T,
+            'solution': self.best_achieved_solution,
+            'leftovers': self.best_achieved_leftovers
+        }
+
+    def get_parameters(self) -> dict:
+        return {
+            'dropout_rate': self.dropout_rate,
+            'RCLs_count': self.RCLs_count,
+            'candidate_k': self.candidate_k,
+            'histogram': self.histogram,
+            'reactive': self.reactive,
+            'reactive_probabilities': {'RCL_count': self.reactive_RCL.get_dict(), 'dropout_rate': self.reactive_dropout.get_dict()} if self.reactive else None,
+            'greedy_calls': self.greedy_calls,
+            'greedy_memo_hits': self.memo_hits,
+            'pool_wins': self.pool_wins,
+            'elite_size': self.elite_pool.size if self.elite_pool != None else 0,
+            'relinks': self.relinks,
+            'relink_improvements': self.relink_improvements,
+            'iterations': self.iterations,
+            'run_time': self.run_time,
+            'best_solution_quality': self.best_achieved_score,
+            'baseline_score': self.base_solution_quality,
+            'iterations_performed': self.iterations_performed,
+            'lower_bound': self.lower_bound,
+            'optimality_gap': self.get_optimality_gap(),
+            'profile': self.profiler.get_dict()
+        }
+
 if __name__ == '__main__':
     grasp = GRASP(verbose=False, dropout_rate=0.2, RCL_count=10)
     grasp.perform_GRASP(iterations=50)
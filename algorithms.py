@@ -0,0 +1,94 @@
+from greedy_solver import GreedySolver
+from GRASP import GRASP
+from genetic_solver import GeneticSolver
+from annealing_solver import AnnealingSolver
+from global_functions import split_sets_by_sum_T
+from collections import Counter
+from typing import List, Tuple
+import random
+
+ALGORITHMS = ['annealing', 'genetic', 'grasp', 'greedy']
+
+DEFAULT_PARAMS = {
+    'annealing': {'moves': 1000000, 'early_stop': True},
+    'genetic': {'pop_size': 100, 'generations': 300000, 'early_stop': True, 'crossover': 'group'},
+    'grasp': {'dropout_rate': 0.8, 'RCL_count': 200, 'iterations': 100, 'candidate_k': 4, 'early_stop': True, 'histogram': 'auto', 'reactive': True, 'elite_size': 10},
+    'greedy': {'list_order': 'desc', 'histogram': 'auto'}
+}
+
+#Budget parameter of every algorithm, greedy has none
+BUDGET_PARAMS = {'annealing': 'moves', 'genetic': 'generations', 'grasp': 'iterations'}
+
+
+#Histogram representation pays off only when values repeat, 'auto' uses it below this ratio of distinct values to elements
+HISTOGRAM_DISTINCT_RATIO = 0.5
+
+
+def use_histogram(problem: list, setting = 'auto') -> bool:
+    '''Resolve histogram setting (True, False or 'auto') for the problem.'''
+    if setting == 'auto':
+        return len(set(problem)) <= HISTOGRAM_DISTINCT_RATIO * len(problem)
+    return bool(setting)
+
+
+def get_algorithm_params(algorithm_name: str, params: dict = None) -> dict:
+    '''Return default parameters of chosen algorithm overridden by `params`.'''
+    merged = dict(DEFAULT_PARAMS[algorithm_name])
+    if params != None:
+        merged.update(params)
+    return merged
+
+
+def run_algorithm(problem: list, T: int, algorithm_name: str, params: dict = None, rng: random.Random = None, reach: int = None) -> Tuple[List[List[int]], List[int], dict]:
+    '''Run chosen algorithm on the problem. `params` override values from `DEFAULT_PARAMS`, `rng` is a generator or seed.
+    `reach` is optional precomputed `bounds.reachable_sums` of the problem or of a superset of it (e.g. before presolve), solvers use it for their lower bound.\n
+    Return solution sets, leftovers, algorithm parameters.'''
+    if len(problem) == 0:
+        return [], [], {}
+
+    if 'grasp' in algorithm_name.lower():
+        params = get_algorithm_params('grasp', params)
+        algorithm = GRASP(problem=problem,
+            T=T,
+            dropout_rate=params['dropout_rate'],
+            RCL_count=params['RCL_count'],
+            rng=rng,
+            profile_path=params.get('profile_path'),
+            candidate_k=params['candidate_k'],
+            early_stop=params['early_stop'],
+            histogram=use_histogram(problem, params['histogram']),
+            reactive=params['reactive'],
+            elite_size=params['elite_size'],
+            reach=reach
+            )
+        algorithm.perform_GRASP(iterations=params['iterations'])
+        return algorithm.get_best_achieved_solution(), algorithm.get_best_achieved_leftovers(), algorithm.get_parameters()
+    #Fitness of GeneticSolver is scaled by standard deviation of the problem, problems with a single distinct value are left to greedy
+    elif 'genetic' in algorithm_name.lower() and len(set(problem)) > 1:
+        params = get_algorithm_params('genetic', params)
+        generations = params.pop('generations')
+        algorithm = GeneticSolver(
+            problem,
+            T=T,
+            silent=True,
+            rng=rng,
+            reach=reach,
+            **params
+        )
+        algorithm.run(generations)
+        solution, leftovers = split_sets_by_sum_T(algorithm.get_solution(), T)
+        return solution, leftovers + algorithm.get_leftovers(), algorithm.get_parameters()
+    elif 'annealing' in algorithm_name.lower():
+        params = get_algorithm_params('annealing', params)
+        moves = params.pop('moves')
+        algorithm = AnnealingSolver(problem, T=T, rng=rng, reach=reach, **params)
+        algorithm.run(moves)
+        return algorithm.get_solution(), algorithm.get_leftovers(), algorithm.get_parameters()
+    else:
+        params = get_algorithm_params('greedy', params if 'greedy' in algorithm_name.lower() else None)
+        algorithm = GreedySolver(verbose=False, rng=rng)
+        if use_histogram(problem, params['histogram']):
+            solution, leftovers, _ = algorithm.greedy_histogram_solution(Counter(problem), T, params['list_order'])
+        else:
+            solution, leftovers, _ = algorithm.greedy_solution(start_set=problem, T=T, list_order=params['list_order'])
+        return solution, leftovers, params
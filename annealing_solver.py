@@ -0,0 +1,268 @@
+import math
+import random
+import sys
+import time
+from collections import defaultdict
+from typing import List
+from greedy_solver import GreedySolver
+from global_functions import calculate_penalty, make_rng
+from bounds import lower_bound_leftovers, optimality_gap
+from profiling import PhaseProfiler, cprofile_export
+
+
+class AnnealingSolver:
+    '''Simulated annealing with tabu tenure on the membership vector representation (0 = leftover, k = set k), same as GeneticSolver.Individual.'''
+
+    def __init__(
+            self,
+            problem: list,
+            T: int,
+            start_temperature: float = 0.5,
+            end_temperature: float = 0.01,
+            swap_rate: float = 0.3,
+            deviation_weight: float = 8.0,
+            tabu_tenure: int = 0,
+            initial: str = 'greedy',
+            early_stop: bool = True,
+            verbose: bool = False,
+            rng: random.Random = None,
+            profile_path: str = None,
+            reach: int = None) -> None:
+        '''
+        Create annealing solver.
+        Params:
+            `problem`: problem set
+            `T`: number to which all the sets should sum up
+            `start_temperature`: initial temperature of Metropolis acceptance
+            `end_temperature`: temperature reached at the end of the move budget, cooling is geometric
+            `swap_rate`: probability of swap move, other moves relocate single element to another set or to leftovers
+            `deviation_weight`: weight of |T - sum| / T in the cost of a set that does not sum to T, guides sets towards T
+            `tabu_tenure`: number of moves for which a moved element cannot be moved again. 0 disables tabu
+            `initial`: 'greedy' to start from greedy solution, 'empty' to start with all elements in leftovers
+            `early_stop`: flag to indicate whether search should stop as soon as the best solution meets the lower bound on leftovers
+            `verbose`: flag to indicate whether there should be any debug output
+            `rng`: random number generator or seed
+            `profile_path`: if provided, every run is profiled with cProfile and stats are dumped to this path
+            `reach`: optional precomputed `bounds.reachable_sums` of the problem (or of a superset of it) for any bound >= T, used by the lower bound
+        '''
+        self.rng = make_rng(rng)
+        self.problem = problem
+        self.T = T
+        self.start_temperature = start_temperature
+        self.end_temperature = end_temperature
+        self.swap_rate = swap_rate
+        self.deviation_weight = deviation_weight
+        self.tabu_tenure = tabu_tenure
+        self.initial = initial
+        self.early_stop = early_stop
+        self.verbose = verbose
+        self.profile_path = profile_path
+        self.profiler = PhaseProfiler()
+
+        self._n = len(problem)
+        assert self._n > 0
+
+        #There can never be more T-sets than sum / T, one spare set lets elements regroup
+        usable_sum = sum([el for el in problem if 0 < el <= T])
+        self.num_sets = max(1, usable_sum // max(1, T)) + 1
+
+        self.solution = self.__initial_solution()
+        self.sums = [0] * (self.num_sets + 1)
+        self.sizes = [0] * (self.num_sets + 1)
+        for i, k in enumerate(self.solution):
+            self.sums[k] += problem[i]
+            self.sizes[k] += 1
+
+        self.lower_bound = lower_bound_leftovers(problem, T, reach=reach)
+        self.cost = sum([self.set_cost(k, self.sums[k], self.sizes[k]) for k in range(self.num_sets + 1)])
+        self.leftover_count = self.__count_leftovers()
+        self.best_solution = list(self.solution)
+        self.best_leftover_count = self.leftover_count
+        self.moves_attempted = 0
+        self.moves_accepted = 0
+        self.run_time = 0
+
+    def __initial_solution(self) -> List[int]:
+        solution = [0] * self._n
+        if self.initial != 'greedy':
+            return solution
+
+        sets, _, _ = GreedySolver(verbose=False, rng=self.rng).greedy_solution(list(self.problem), self.T, 'desc')
+
+        #Map values of greedy sets back to element indexes
+        indexes = defaultdict(list)
+        for i, el in enumerate(self.problem):
+            indexes[el].append(i)
+        for k, s in enumerate(sets[:self.num_sets], 1):
+            for el in s:
+                solution[indexes[el].pop()] = k
+        return solution
+
+    def set_cost(self, k: int, s: int, size: int) -> float:
+        '''Cost of set k with sum s and size elements. Every element of leftovers or of a set not summing to T costs 1'''
+        if k == 0:
+            return size
+        if s == self.T:
+            return 0.0
+        return size + self.deviation_weight * abs(self.T - s) / self.T
+
+    def __count_leftovers(self) -> int:
+        return self.sizes[0] + sum([self.sizes[k] for k in range(1, self.num_sets + 1) if self.sums[k] != self.T])
+
+    def run(self, moves: int = 1000000, time_limit: float = None) -> None:
+        '''
+        Perform annealing.
+        Params:
+            `moves`: move budget, temperature reaches `end_temperature` after it
+            `time_limit`: optional limit of run time in seconds
+        '''
+        with cprofile_export(self.profile_path), self.profiler.run():
+            self._run(moves, time_limit)
+
+    def _run(self, moves: int, time_limit: float) -> None:
+        start_time = time.perf_counter()
+        problem = self.problem
+        solution = self.solution
+        sums = self.sums
+        sizes = self.sizes
+        set_cost = self.set_cost
+        rng_random = self.rng.random
+        rng_randrange = self.rng.randrange
+        n = self._n
+        num_sets = self.num_sets
+        tabu_until = [0] * n
+
+        temperature = self.start_temperature
+        cooling = (self.end_temperature / self.start_temperature) ** (1 / max(1, moves))
+        accepted = 0
+        attempted = moves
+
+        for move in range(moves):
+            temperature *= cooling
+
+            #Checking clock and bound is not free, do it once per 1024 moves
+            if move & 1023 == 0:
+                if time_limit != None and time.perf_counter() - start_time > time_limit:
+                    attempted = move
+                    break
+                if self.early_stop and self.best_leftover_count <= self.lower_bound:
+                    attempted = move
+                    break
+
+            i = rng_randrange(n)
+            if tabu_until[i] > move:
+                continue
+            a = solution[i]
+            el = problem[i]
+
+            if rng_random() < self.swap_rate:
+                j = rng_randrange(n)
+                b = solution[j]
+                if a == b or tabu_until[j] > move:
+                    continue
+                diff = problem[j] - el
+                new_a = sums[a] + diff
+                new_b = sums[b] - diff
+                delta = set_cost(a, new_a, sizes[a]) + set_cost(b, new_b, sizes[b]) - set_cost(a, sums[a], sizes[a]) - set_cost(b, sums[b], sizes[b])
+
+                if delta <= 0 or rng_random() < math.exp(-delta / temperature):
+                    self.leftover_count += self.__leftover_change(a, sums[a], new_a, sizes[a], sizes[a]) + self.__leftover_change(b, sums[b], new_b, sizes[b], sizes[b])
+                    sums[a] = new_a
+                    sums[b] = new_b
+                    solution[i], solution[j] = b, a
+                    tabu_until[i] = tabu_until[j] = move + self.tabu_tenure
+                    self.cost += delta
+                    accepted += 1
+            else:
+                b = rng_randrange(num_sets + 1)
+                if a == b:
+                    continue
+                new_a = sums[a] - el
+                new_b = sums[b] + el
+                delta = set_cost(a, new_a, sizes[a] - 1) + set_cost(b, new_b, sizes[b] + 1) - set_cost(a, sums[a], sizes[a]) - set_cost(b, sums[b], sizes[b])
+
+                if delta <= 0 or rng_random() < math.exp(-delta / temperature):
+                    self.leftover_count += self.__leftover_change(a, sums[a], new_a, sizes[a], sizes[a] - 1) + self.__leftover_change(b, sums[b], new_b, sizes[b], sizes[b] + 1)
+                    sums[a] = new_a
+                    sums[b] = new_b
+                    sizes[a] -= 1
+                    sizes[b] += 1
+                    solution[i] = b
+                    tabu_until[i] = move + self.tabu_tenure
+                    self.cost += delta
+                    accepted += 1
+
+            if self.leftover_count < self.best_leftover_count:
+                self.best_leftover_count = self.leftover_count
+                self.best_solution = list(solution)
+
+        #Attempted moves include tabu skips and rejected proposals, only accepted moves changed the solution
+        self.moves_attempted += attempted
+        self.moves_accepted += accepted
+        self.profiler.count('attempted', attempted)
+        self.profiler.count('accepted', accepted)
+        self.run_time += time.perf_counter() - start_time
+        self.debug_message(f'Annealing finished with {self.best_leftover_count} leftovers, lower bound {self.lower_bound}')
+
+    def __leftover_change(self, k: int, old_sum: int, new_sum: int, old_size: int, new_size: int) -> int:
+        '''Change of the number of elements outside of T-sets when set k changes'''
+        old = old_size if k == 0 or old_sum != self.T else 0
+        new = new_size if k == 0 or new_sum != self.T else 0
+        return new - old
+
+    def debug_message(self, message) -> None:
+        '''Print message'''
+        if self.verbose:
+            print(message, file=sys.stderr)
+
+    def get_solution(self) -> List[List[int]]:
+        '''Return sets of best solution that sum to T'''
+        sets = [[] for _ in range(self.num_sets + 1)]
+        for i, k in enumerate(self.best_solution):
+            sets[k].append(self.problem[i])
+        return [s for s in sets[1:] if len(s) > 0 and sum(s) == self.T]
+
+    def get_leftovers(self) -> List[int]:
+        '''Return elements of best solution that are not a member of any T-set'''
+        sums = [0] * (self.num_sets + 1)
+        for i, k in enumerate(self.best_solution):
+            sums[k] += self.problem[i]
+        return [self.problem[i] for i, k in enumerate(self.best_solution) if k == 0 or sums[k] != self.T]
+
+    def get_solution_penalty(self) -> float:
+        return calculate_penalty(self.T, self.get_solution(), self.get_leftovers())
+
+    def get_result_dict(self) -> dict:
+        return {
+            'problem': self.problem,
+            'T': self.T,
+            'solution': self.get_solution(),
+            'leftovers': self.get_leftovers()
+        }
+
+    def get_parameters(self) -> dict:
+        return {
+            'start_temperature': self.start_temperature,
+            'end_temperature': self.end_temperature,
+            'swap_rate': self.swap_rate,
+            'deviation_weight': self.deviation_weight,
+            'tabu_tenure': self.tabu_tenure,
+            'initial': self.initial,
+            'moves_attempted': self.moves_attempted,
+            'moves_accepted': self.moves_accepted,
+            'moves_per_second': self.moves_attempted / max(1e-9, self.run_time),
+            'run_time': self.run_time,
+            'lower_bound': self.lower_bound,
+            'optimality_gap': optimality_gap(self.best_leftover_count, self.lower_bound, self._n),
+            'profile': self.profiler.get_dict()
+        }
+
+
+if __name__ == '__main__':
+    from generator import Generator
+
+    rng = make_rng()
+    problem = Generator(rng).generate_random_multiset(1000, 0, 300)
+    annealing = AnnealingSolver(problem, 1000, tabu_tenure=5, verbose=True, rng=rng)
+    annealing.run(1000000)
+    print(f'Score: {annealing.get_solution_penalty()}, {annealing.get_parameters()["moves_per_second"]:.0f} moves per second')
@@ -1,36 +1,196 @@
 from collections import defaultdict
+from typing import List, Tuple
+from datetime import datetime
+import argparse
+import json
+import platform
+import sys
 import time
-from generator import Generator 
-import random
-from GRASP import GRASP
-from greedy_solver import GreedySolver
-import matplotlib.pyplot as plt
-
-random.seed(time.time())
-
-TARR = [50000, 100000, 150000, 200000, 250000] 
-ITERATIONS = len(TARR)
-generator = Generator()
-results = defaultdict(list)
-
-for i, T in enumerate(TARR):
-    problemset = generator.generate_random_set(size=10000, low=0, high=20000)
-    
-    grasp = GRASP(verbose=False, problem=problemset, T=T)
-    grasp.perform_GRASP(15)
-    results['GRASP'].append(grasp.get_best_achieved_score())
-
-    greedy = GreedySolver(verbose=False)
-    _, _, pen = greedy.greedy_solution(start_set=problemset, T=T, list_order='desc')
-    results['Greedy'].append(pen)
-
-fig= plt.figure()
-labels = ['GRASP', 'Greedy']
-averages = [sum(results[key])/len(results[key]) for key in labels]
-plt.bar(labels, averages)
-plt.xlabel('Algorithms')
-plt.ylabel('Score (the lower the better)')
-plt.title('Algorithm quality comparison')
-plt.show()
-
-print(labels, averages)
\ No newline at end of file
+import tracemalloc
+from generator import Generator
+from global_functions import calculate_penalty
+from solve import solve_problem
+from algorithms import BUDGET_PARAMS
+
+FAMILIES = ['random_set', 'random_multiset', 'planted']
+SIZES = [100, 1000, 10000, 100000, 1000000]
+SEEDS = [1, 2, 3]
+
+#Solver configurations, `max_size` keeps slow solvers away from instances they cannot finish in reasonable time.
+#It is a size, or a dict of sizes per family with 'default' for the other families.
+#Caps follow measured wall times. List greedy is quadratic in distinct values: 1.5s on random_set of 10000 elements, 7s at 20000,
+#50-80s on multisets of 100000. Histogram greedy compresses nothing on all-distinct random_set (12s at 20000), but takes 1s on multisets of 1000000.
+#Annealing starts from list greedy (2-6s at 10000), group crossover takes 35-95s on random_set of 1000
+CONFIGS = {
+    'greedy': {'algorithm': 'greedy', 'presolve': False, 'params': {'histogram': False}, 'max_size': 20000},
+    'greedy+histogram': {'algorithm': 'greedy', 'presolve': False, 'params': {'histogram': True}, 'max_size': {'random_set': 20000, 'default': 1000000}},
+    'greedy+presolve': {'algorithm': 'greedy', 'presolve': True, 'params': {}, 'max_size': {'random_set': 20000, 'default': 1000000}},
+    'grasp': {'algorithm': 'grasp', 'presolve': False, 'params': {'RCL_count': 20, 'iterations': 15, 'candidate_k': 0, 'reactive': False, 'elite_size': 0}, 'max_size': 1000},
+    'grasp+presolve': {'algorithm': 'grasp', 'presolve': True, 'params': {'RCL_count': 20, 'iterations': 15, 'candidate_k': 0, 'reactive': False, 'elite_size': 0}, 'max_size': 1000},
+    'grasp+candidates': {'algorithm': 'grasp', 'presolve': True, 'params': {'RCL_count': 20, 'iterations': 15, 'candidate_k': 4, 'reactive': False, 'elite_size': 0}, 'max_size': 10000},
+    'grasp+reactive': {'algorithm': 'grasp', 'presolve': True, 'params': {'RCL_count': 20, 'iterations': 15, 'candidate_k': 0, 'reactive': True, 'elite_size': 0}, 'max_size': 1000},
+    'grasp+relinking': {'algorithm': 'grasp', 'presolve': True, 'params': {'RCL_count': 20, 'iterations': 15, 'candidate_k': 0, 'reactive': True, 'elite_size': 10}, 'max_size': 1000},
+    'annealing': {'algorithm': 'annealing', 'presolve': True, 'params': {'moves': 200000}, 'max_size': 20000},
+    'genetic': {'algorithm': 'genetic', 'presolve': False, 'params': {'pop_size': 50, 'generations': 500, 'crossover': 'uniform'}, 'max_size': 1000},
+    'genetic+group': {'algorithm': 'genetic', 'presolve': True, 'params': {'pop_size': 50, 'generations': 500, 'crossover': 'group'}, 'max_size': 1000}
+}
+
+
+def generate_instance(family: str, size: int, seed: int) -> Tuple[List[int], int]:
+    '''Generate benchmark instance of a given family. The same (family, size, seed) always gives the same instance.\n
+    Return problem, T.'''
+    generator = Generator(seed)
+
+    if family == 'random_set':
+        #Values are dense in [0:2*size], T-sets have 2-3 elements on average
+        return generator.generate_random_set(size, 0, 2 * size), 2 * size
+    elif family == 'random_multiset':
+        return generator.generate_random_multiset(size, 0, 1000), 2500
+    elif family == 'planted':
+        #Planted sets have 4 elements on average, optimal solution leaves no leftovers
+        problem, _ = generator.generate_planted_solution(max(1, size // 4), 2500)
+        return problem, 2500
+    else:
+        raise ValueError(f'Unknown instance family {family}')
+
+
+def config_max_size(config: dict, family: str) -> int:
+    '''Largest instance size of the family the configuration is run on'''
+    max_size = config['max_size']
+    if isinstance(max_size, dict):
+        return max_size.get(family, max_size['default'])
+    return max_size
+
+
+def measure(problem: list, T: int, config: dict, seed: int, trace_memory: bool = False, calibration: bool = False) -> dict:
+    '''Run single solver configuration with seeded generator on the problem and measure it.\n
+    With `trace_memory` peak memory is measured in a second run of the same seed, tracemalloc slows solvers down many times and would distort the wall time.\n
+    With `calibration` the whole budget is run without early stops, and configurations with a budget are run once more with budget 1,
+    its wall time is the fixed cost of the configuration (base solution, bounds) reported as 'fixed_time', see `selector.calibrate`.'''
+    start_time = time.perf_counter()
+    result, _ = solve_problem(problem, T, config['algorithm'], presolve=config['presolve'], params=config['params'], rng=seed, early_stop=not calibration)
+    wall_time = time.perf_counter() - start_time
+
+    peak_memory = None
+    if trace_memory:
+        tracemalloc.start()
+        solve_problem(problem, T, config['algorithm'], presolve=config['presolve'], params=config['params'], rng=seed)
+        _, peak_memory = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+
+    measurement = {
+        'wall_time': wall_time,
+        'throughput': len(problem) / max(wall_time, 1e-9),
+        'peak_memory': peak_memory,
+        'penalty': calculate_penalty(T, result['solution'], result['leftovers']),
+        'leftovers': len(result['leftovers'])
+    }
+
+    budget_name = BUDGET_PARAMS.get(config['algorithm'])
+    if calibration and budget_name != None:
+        start_time = time.perf_counter()
+        solve_problem(problem, T, config['algorithm'], presolve=config['presolve'], params=dict(config['params'], **{budget_name: 1}), rng=seed, early_stop=False)
+        measurement['fixed_time'] = time.perf_counter() - start_time
+    return measurement
+
+
+def run_benchmark(families: list, sizes: list, seeds: list, configs: list, trace_memory: bool = False, calibration: bool = False) -> dict:
+    '''Run every configuration on every instance it can handle, `trace_memory` and `calibration` see `measure`.\n
+    Return machine-readable benchmark report.'''
+    report = {
+        'meta': {
+            'date': datetime.now().strftime("%Y-%m-%d_%H-%M-%S"),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'calibration': calibration
+        },
+        'results': list()
+    }
+
+    for family in families:
+        for size in sizes:
+            for seed in seeds:
+                problem, T = generate_instance(family, size, seed)
+                for name in configs:
+                    config = CONFIGS[name]
+                    if size > config_max_size(config, family):
+                        continue
+
+                    entry = {'instance': f'{family}/{size}/{seed}', 'family': family, 'size': size, 'seed': seed, 'T': T, 'solver': name}
+                    entry.update(measure(problem, T, config, seed, trace_memory, calibration))
+                    report['results'].append(entry)
+                    print(f"{entry['instance']:>28} {name:>16} time {entry['wall_time']:9.3f}s penalty {entry['penalty']:.4f}", file=sys.stderr)
+
+    return report
+
+
+def compare_with_baseline(report: dict, baseline: dict, time_tolerance: float = 0.2, penalty_tolerance: float = 0.0, min_time: float = 0.05) -> List[str]:
+    '''Compare benchmark report with a stored baseline report.\n
+    Return list of regression descriptions. Timings below `min_time` seconds are treated as noise.'''
+    base = {(e['instance'], e['solver']): e for e in baseline['results']}
+    regressions = list()
+
+    for entry in report['results']:
+        key = (entry['instance'], entry['solver'])
+        if key not in base:
+            continue
+        old = base[key]
+
+        if entry['wall_time'] > min_time and entry['wall_time'] > old['wall_time'] * (1 + time_tolerance):
+            regressions.append(f"{key[0]} {key[1]}: wall time {old['wall_time']:.3f}s -> {entry['wall_time']:.3f}s")
+        if entry['penalty'] > old['penalty'] + penalty_tolerance:
+            regressions.append(f"{key[0]} {key[1]}: penalty {old['penalty']:.4f} -> {entry['penalty']:.4f}")
+
+    return regressions
+
+
+def plot_report(report: dict) -> None:
+    import matplotlib.pyplot as plt
+
+    results = defaultdict(list)
+    for entry in report['results']:
+        results[entry['solver']].append(entry['penalty'])
+
+    labels = list(results.keys())
+    averages = [sum(results[key])/len(results[key]) for key in labels]
+    plt.figure()
+    plt.bar(labels, averages)
+    plt.xlabel('Algorithms')
+    plt.ylabel('Score (the lower the better)')
+    plt.title('Algorithm quality comparison')
+    plt.show()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--families', nargs="+", default=FAMILIES, choices=FAMILIES, help="Instance families to run")
+    parser.add_argument('--sizes', nargs="+", type=int, default=SIZES, help="Instance sizes to run")
+    parser.add_argument('--seeds', nargs="+", type=int, default=SEEDS, help="Instance seeds to run")
+    parser.add_argument('--solvers', nargs="+", default=list(CONFIGS.keys()), choices=list(CONFIGS.keys()), help="Solver configurations to run")
+    parser.add_argument('-o', '--output', type=str, default='benchmark_results.json', help="Path to save results at", metavar="PATH")
+    parser.add_argument('-b', '--baseline', type=str, default=None, help="Baseline results to compare with", metavar="PATH")
+    parser.add_argument('--time-tolerance', type=float, default=0.2, dest="time_tolerance", help="Allowed relative wall time increase over baseline")
+    parser.add_argument('--penalty-tolerance', type=float, default=0.0, dest="penalty_tolerance", help="Allowed absolute penalty increase over baseline")
+    parser.add_argument('--memory', action="store_true", dest="trace_memory", help="Also measure peak memory, in a separate run of every configuration (tracing slows solvers down)")
+    parser.add_argument('--calibration', action="store_true", help="Measure for cost model of selector.py: full budgets without early stops and fixed cost of every configuration")
+    parser.add_argument('--plot', action="store_true", help="Show average penalty of every solver")
+    args = parser.parse_args()
+
+    report = run_benchmark(args.families, args.sizes, args.seeds, args.solvers, args.trace_memory, args.calibration)
+
+    with open(args.output, 'w') as f:
+        json.dump(report, f, indent=1)
+        print(f'Saved {len(report["results"])} results to {args.output}')
+
+    if args.plot:
+        plot_report(report)
+
+    if args.baseline != None:
+        with open(args.baseline) as f:
+            regressions = compare_with_baseline(report, json.load(f), args.time_tolerance, args.penalty_tolerance)
+
+        for regression in regressions:
+            print(f'REGRESSION {regression}')
+        if len(regressions) > 0:
+            exit(1)
+        print('No regressions against baseline')
@@ -0,0 +1,67 @@
+from collections import Counter
+from typing import List
+
+
+def reachable_sums(problem: list, T: int) -> int:
+    '''Compute bitset of all subset sums in range 0-T reachable from (non-negative) problem. Bit s is set if sum s is reachable.'''
+    mask = (1 << (T + 1)) - 1
+    reach = 1
+    for el, cnt in Counter(problem).items():
+        if el <= 0 or el > T:
+            continue
+        #Copies above T//el can never be used together
+        for _ in range(min(cnt, T // el)):
+            reach = (reach | (reach << el)) & mask
+    return reach
+
+
+def unusable_elements(problem: list, T: int, reachability_limit: int = 10**7, reach: int = None) -> List[int]:
+    '''Return elements that cannot be a member of any subset summing to T.\n
+    Elements above T are always unusable, for T up to `reachability_limit` also those whose complement T-el is not a reachable sum.
+    `reach` is optional precomputed `reachable_sums` of the problem for any bound >= T, so it can be shared across many T values.'''
+    unusable = [el for el in problem if el > T]
+    if T > reachability_limit:
+        return unusable
+
+    if reach == None:
+        reach = reachable_sums(problem, T)
+    return unusable + [el for el in problem if el <= T and not (reach >> (T - el)) & 1]
+
+
+def lower_bound_leftovers(problem: list, T: int, reachability_limit: int = 10**7, reach: int = None) -> int:
+    '''Compute cheap lower bound on the number of leftovers of any solution.\n
+    Bound is the number of unusable elements plus the elements needed to cover the sum of usable elements modulo T,
+    because sum of all used elements is a multiple of T. For problems with negative elements or T <= 0 nothing is proven and 0 is returned.'''
+    if len(problem) == 0 or T <= 0 or min(problem) < 0:
+        return 0
+
+    unusable = Counter(unusable_elements(problem, T, reachability_limit, reach))
+    usable = list()
+    for el in problem:
+        if unusable[el] > 0:
+            unusable[el] -= 1
+        else:
+            usable.append(el)
+    bound = len(problem) - len(usable)
+
+    remainder = sum(usable) % T
+    if remainder > 0:
+        #Leftover usable elements sum to at least remainder, each of them is at most max(usable)
+        bound += -(-remainder // max(usable))
+
+    return bound
+
+
+def optimality_gap(leftover_count: int, lower_bound: int, n: int) -> float:
+    '''Difference between leftover ratio of a solution of n elements and the lower bound on it, 0 means the solution is proven optimal.'''
+    return (leftover_count - lower_bound) / max(0.0001, n)
+
+
+def lower_bound_penalty(problem: list, T: int, penalty_magnitude: int = 1) -> float:
+    '''Lower bound on `calculate_penalty` of any solution.'''
+    return lower_bound_leftovers(problem, T) * penalty_magnitude / max(0.0001, len(problem))
+
+
+if __name__ == '__main__':
+    print(lower_bound_leftovers([1, 9, 2, 8, 3, 7, 4, 6], 12))
+    print(lower_bound_leftovers([3, 5, 25, 7, 100], 10))
@@ -0,0 +1,133 @@
+from collections import Counter
+from typing import Dict, List, Tuple
+
+
+class CandidatePool:
+    '''Pool of small T-subsets (pairs, triples, quadruples) among leftovers, found by hash joins over value counts.'''
+
+    def __init__(self, T: int, elements: list = [], max_k: int = 4, quad_limit: int = 150, max_candidates: int = 20000, per_value_limit: int = 16) -> None:
+        '''
+        Create candidate pool and search it over initial elements.
+        Params:
+            `T`: number to which all the sets should sum up
+            `elements`: initial leftovers
+            `max_k`: maximal size of candidate subset, between 2 and 4
+            `quad_limit`: quadruples are searched only while there are at most this many distinct values, search is quadratic in them
+            `max_candidates`: maximal number of stored candidates, bounds memory of the pool
+            `per_value_limit`: maximal number of triples (and of quadruples) generated for a single added value, keeps the search close to linear and the pool spread over many values
+        '''
+        assert 2 <= max_k <= 4, 'Candidate subsets should have between 2 and 4 elements'
+        self.T = T
+        self.max_k = max_k
+        self.quad_limit = quad_limit
+        self.max_candidates = max_candidates
+        self.per_value_limit = per_value_limit
+        self.counts = Counter()
+        #Candidates are invalidated lazily: removed values only change counts, extraction drops unsupported candidates
+        self.candidates: Dict[Tuple[int, ...], None] = dict()
+        #Candidates in priority order, new ones are appended and merged into the sorted prefix on next extraction
+        self.ordered: List[Tuple[int, ...]] = list()
+        self.unsorted = False
+
+        self.add(elements)
+
+    def add(self, elements: list) -> None:
+        '''Add elements to the pool and search new candidates containing them.'''
+        for el in elements:
+            self.counts[el] += 1
+        for el in set(elements):
+            self.__search_with(el)
+
+    def remove(self, elements: list) -> None:
+        '''Remove elements from the pool.'''
+        for el in elements:
+            self.counts[el] -= 1
+            if self.counts[el] <= 0:
+                del self.counts[el]
+
+    def extract(self, tabu: set = None) -> List[List[int]]:
+        '''Return disjoint candidates supported by current elements, in priority order: smaller subsets first, then larger elements first.
+        Candidates in `tabu` (sorted tuples) are skipped but stay in the pool.\n
+        Pool is not modified, chosen sets should be removed by the caller.'''
+        if self.unsorted:
+            #Sorted prefix with appended tail is merged by Timsort in about linear time
+            self.ordered.sort(key=lambda c: (len(c), -c[-1]))
+            self.unsorted = False
+
+        remaining = Counter(self.counts)
+        chosen = list()
+        kept = list()
+
+        for candidate in self.ordered:
+            needed = Counter(candidate)
+            if not self.__is_supported(needed, self.counts):
+                del self.candidates[candidate]
+                continue
+            kept.append(candidate)
+            if tabu and candidate in tabu:
+                continue
+
+            while self.__is_supported(needed, remaining):
+                chosen.append(list(candidate))
+                remaining.subtract(needed)
+
+        self.ordered = kept
+        return chosen
+
+    def __is_supported(self, needed: Counter, counts: Counter) -> bool:
+        for el, cnt in needed.items():
+            if counts[el] < cnt:
+                return False
+        return True
+
+    def __store(self, *elements) -> bool:
+        '''Store candidate, return whether it is new'''
+        if len(self.candidates) >= self.max_candidates:
+            return False
+        candidate = tuple(sorted(elements))
+        if candidate not in self.candidates and self.__is_supported(Counter(candidate), self.counts):
+            self.candidates[candidate] = None
+            self.ordered.append(candidate)
+            self.unsorted = True
+            return True
+        return False
+
+    def __search_with(self, v: int) -> None:
+        '''Search candidates that contain value `v`, at most `per_value_limit` of every size above 2.'''
+        if v <= 0 or v >= self.T or len(self.candidates) >= self.max_candidates:
+            return
+
+        rest = self.T - v
+
+        #Pairs: single hash lookup
+        if rest in self.counts:
+            self.__store(v, rest)
+
+        #Triples: hash join of values with their complement, stops as soon as enough are found
+        if self.max_k >= 3:
+            found = 0
+            for b in self.counts:
+                c = rest - b
+                if 0 < b <= c and c in self.counts and self.__store(v, b, c):
+                    found += 1
+                    if found >= self.per_value_limit:
+                        break
+
+        #Quadruples: meet in the middle over sorted values
+        if self.max_k >= 4 and len(self.counts) <= self.quad_limit:
+            values = sorted(el for el in self.counts if 0 < el < rest)
+            found = 0
+            for i, b in enumerate(values):
+                for c in values[i:]:
+                    d = rest - b - c
+                    if d < c:
+                        break
+                    if d in self.counts and self.__store(v, b, c, d):
+                        found += 1
+                if found >= self.per_value_limit:
+                    break
+
+
+if __name__ == '__main__':
+    pool = CandidatePool(10, [1, 9, 2, 8, 3, 7, 4, 6, 5, 1, 1, 1, 2, 4])
+    print(pool.extract())
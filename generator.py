@@ -1,37 +1,80 @@
 import random
-from typing import List
+from typing import List, Tuple
 import numpy as np
 import sys
-
-random.seed(321)
+from global_functions import make_rng
 
 class Generator:
     '''Problem generator'''
 
-    def __init__(self) -> None:
-        self.possible_subsets = []
+    def __init__(self, rng: random.Random = None) -> None:
+        '''
+        Params:
+            `rng`: random number generator or seed. Vectorized methods use numpy Generator seeded from it
+        '''
+        self.rng = make_rng(rng)
+        self.np_rng = np.random.default_rng(self.rng.getrandbits(64))
     
     def generate_random_set(self, size: int, low: int = 0, high: int = 100) -> List[int]:
         '''Generate set of unique integers in range [low:high].\n
         Return set.'''
         assert high-low >= size, 'Range should be equal or greater than set size'
         assert high>low, 'Upper bound should be greater than lower bound'
-        s = random.sample(range(low,high), size) 
+        s = self.rng.sample(range(low,high), size) 
         return s
     
     def generate_random_multiset(self, size: int, low: int = 0, high: int = 100) -> List[int]:
         '''Generate multiset of integers in range [low:high].\n
         Return set.'''
         assert high>low, 'Upper bound should be greater than lower bound'
-        s = [random.randint(low,high) for _ in range(size)]
+        s = [self.rng.randint(low,high) for _ in range(size)]
         return s
 
+    def generate_planted_solution(self, set_count: int, T: int, min_set_size: int = 2, max_set_size: int = 6, noise_size: int = 0, noise_low: int = None, noise_high: int = None) -> Tuple[List[int], List[int]]:
+        '''Generate multiset with planted solution of `set_count` sets summing to T, plus `noise_size` noise elements.\n
+        Every planted set is a random composition of T into positive parts, sampled in bulk with numpy.
+        Noise is drawn from [noise_low:noise_high], by default from [T+1:2T], so it can never be used and the planted solution is optimal.
+        With noise in [1:T] the planted solution is only an upper bound on the optimum.\n
+        Return problem, membership vector of the planted solution (0 = noise, k = planted set k).'''
+        assert min_set_size >= 1 and max_set_size >= min_set_size, 'Set size bounds are invalid'
+        assert T >= max_set_size, 'T should be at least max_set_size, parts have to be positive'
+
+        sizes = self.np_rng.integers(min_set_size, max_set_size + 1, size=set_count)
+        set_ids = np.arange(1, set_count + 1)
+        values = list()
+        membership = list()
+
+        for k in np.unique(sizes):
+            ids = set_ids[sizes == k]
+
+            #Composition of T into k positive parts is given by k-1 distinct cut points in [1:T-1]
+            cuts = np.sort(self.np_rng.integers(1, T, size=(len(ids), k - 1)), axis=1)
+            duplicated = np.any(np.diff(cuts, axis=1) == 0, axis=1)
+            while np.any(duplicated):
+                cuts[duplicated] = np.sort(self.np_rng.integers(1, T, size=(int(duplicated.sum()), k - 1)), axis=1)
+                duplicated = np.any(np.diff(cuts, axis=1) == 0, axis=1)
+
+            bounds = np.hstack([np.zeros((len(ids), 1), dtype=cuts.dtype), cuts, np.full((len(ids), 1), T, dtype=cuts.dtype)])
+            values.append(np.diff(bounds, axis=1).ravel())
+            membership.append(np.repeat(ids, k))
+
+        noise_low = T + 1 if noise_low == None else noise_low
+        noise_high = 2 * T if noise_high == None else noise_high
+        values.append(self.np_rng.integers(noise_low, noise_high + 1, size=noise_size))
+        membership.append(np.zeros(noise_size, dtype=set_ids.dtype))
+
+        values = np.concatenate(values)
+        membership = np.concatenate(membership)
+        order = self.np_rng.permutation(len(values))
+
+        return values[order].tolist(), membership[order].tolist()
+
     def generate_set_with_guaranteed_solution(self, size: int, T: int, max_num: int) -> List[int]:
-        '''DO NOT USE, POSSIBLE TO GET STUCK. Generate set that has solution of approx size. 
+        '''DO NOT USE, POSSIBLE TO GET STUCK, use `generate_planted_solution` instead. Generate set that has solution of approx size. 
         This is a greedy algorithm that allows little extensions of size and max_num after a size^3 iterations.
         To easily generate '''
         ints = [i for i in range(0, max_num+1)]
-        random.shuffle(ints)
+        self.rng.shuffle(ints)
         ints = np.array(ints)
         set = []
         original_size = size
@@ -60,7 +103,7 @@ class Generator:
                 ints = np.delete(ints, indexes_to_remove)
 
             #shufle and extend to avoid local minimum
-            np.random.shuffle(ints)
+            self.np_rng.shuffle(ints)
             tmp_sum = 0
             tmp_set = []
 
@@ -79,58 +122,61 @@ class Generator:
 
         return set
 
-    def __gen_subsets_that_sum_to_T(self, numbers, T, partial=[]):
-        '''Generate all possible subsets from [numbers] with sum of T.'''
-        s = sum(partial)
-        #Check if partial sum equals T
-        if s == T: 
-            self.possible_subsets.append(partial)
-
-        #Stop if the T is reached
-        if s >= T:
-            return
-        
-        #Create all possible combinations
-        for i in range(len(numbers)):
-            n = numbers[i]
-            remaining = numbers[i+1:]
-            self.__gen_subsets_that_sum_to_T(remaining, T, partial + [n]) 
+    def __sample_subset_that_sums_to_T(self, numbers: np.ndarray, T: int) -> List[int]:
+        '''Draw random subset of [numbers] with sum of T without enumerating subsets.\n
+        Reachability DP over sums 0-T with a parent pointer per sum, numbers are processed in random order.
+        Memory is proportional to T.\n
+        Return indexes of subset in [numbers], empty list if T is not reachable.'''
+        reachable = np.zeros(T + 1, dtype=bool)
+        reachable[0] = True
+        parent = np.full(T + 1, -1, dtype=np.int64)
+
+        for idx in self.np_rng.permutation(len(numbers)):
+            n = int(numbers[idx])
+            if n <= 0 or n > T:
+                continue
+
+            #Sums reachable only with this number point to it. Their remainder was reachable before, so chains never reuse a number
+            newly = np.flatnonzero(reachable[:T + 1 - n] & ~reachable[n:]) + n
+            reachable[newly] = True
+            parent[newly] = idx
+
+            if reachable[T]:
+                break
+
+        if not reachable[T]:
+            return []
+
+        subset = []
+        s = T
+        while s > 0:
+            idx = int(parent[s])
+            subset.append(idx)
+            s -= int(numbers[idx])
+        return subset
 
     def generate_proceural_guaranteed_solution(self, T, dropout=.3, numbers=[]) -> List[int]:
-        '''Generate set of integers with subsets that sum of T.'''
-        #Generate all subsets with sum of T. If numbers list is not passed then create list of numbers in range 0-T with given dropout rate
-        self.__gen_subsets_that_sum_to_T(
-            numbers if len(numbers)>0 else list(filter(lambda _: random.random() > dropout ,[i for i in range(0, T)])), 
-            T
-            )
-        #Reference array to mark taken elements 
-        solution = [0 for i in range(0, T)]
+        '''Generate set of integers with subsets that sum of T.\n
+        Disjoint subsets are sampled one by one until T is no longer reachable, so T in the thousands is fine.'''
+        #If numbers list is not passed then create list of numbers in range 0-T with given dropout rate
+        pool = np.array(numbers if len(numbers)>0 else list(filter(lambda _: self.rng.random() > dropout ,[i for i in range(0, T)])), dtype=np.int64)
+        ret = []
         subset_count = 0
 
-        for subset in self.possible_subsets:
-            #Check if all numbers are not overlapping with those already taken
-            all = True
-            for num in subset:
-                if solution[num] == 1:
-                    all = False
+        while len(pool) > 0:
+            subset = self.__sample_subset_that_sums_to_T(pool, T)
+            if len(subset) == 0:
+                break
 
             #Chance to drop subset in order to achieve more randomness in generated solution
-            if random.random() < dropout:
-                all = False
-
-            #Add subset to solution
-            if all:
-                for num in subset:
-                    solution[num] = 1
+            if self.rng.random() >= dropout:
+                ret += pool[subset].tolist()
                 subset_count+=1
 
-        #Change indexes into numbers
-        ret = []
-        for num, flag in enumerate(solution):
-            if flag == 1:
-                ret.append(num)
+            pool = np.delete(pool, subset)
 
-        print(f'Generated set with {subset_count} non-overlapping subsets each of which has the sum of {T}: {set}', file=sys.stderr)
+        ret.sort()
+        print(f'Generated set with {subset_count} non-overlapping subsets each of which has the sum of {T}: {ret}', file=sys.stderr)
         return ret
 
 
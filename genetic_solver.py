@@ -10,6 +10,9 @@ import matplotlib.pyplot as plt
 from generator import Generator
 from greedy_solver import GreedySolver
 from GRASP import GRASP
+from global_functions import make_rng
+from profiling import PhaseProfiler, cprofile_export
+from bounds import lower_bound_leftovers, optimality_gap
 
 class GeneticSolver:
 
@@ -35,13 +38,103 @@ class GeneticSolver:
             Params:
                 `other`: other individual instance to perform crossover with
             '''
-            selection = [random.choice([False, True]) for _ in range(self._solver._n)]
+            selection = [self._solver.rng.choice([False, True]) for _ in range(self._solver._n)]
             selector = lambda i: self.solution[i] * selection[i] + other.solution[i] * (not selection[i])
 
             ind = GeneticSolver.Individual([selector(i) for i in range(self._solver._n)], self._solver)
 
             return ind
         
+        def group_cross(self, other: 'GeneticSolver.Individual') -> 'GeneticSolver.Individual':
+            '''
+            Perform group-preserving crossover between this individual and `other`, return the child.
+            Complete T-sets of both parents are inherited whole, in random order, while they do not overlap.
+            Remaining genes are repaired with first-fit decreasing greedy. Sums of inherited sets are reused, no recalculation is needed
+            Params:
+                `other`: other individual instance to perform crossover with
+            '''
+            groups = self.get_groups() + other.get_groups()
+            self._solver.rng.shuffle(groups)
+
+            taken = [False] * self._solver._n
+            inherited = []
+            for group in groups:
+                if any(taken[i] for i in group):
+                    continue
+                for i in group:
+                    taken[i] = True
+                inherited.append(group)
+
+            free = [i for i in range(self._solver._n) if not taken[i]]
+            free.sort(key=lambda i: self._solver.problem[i], reverse=True)
+
+            return GeneticSolver.Individual.from_groups(inherited, free, self._solver)
+
+        def group_mutate(self, probability: float = 0.01) -> None:
+            '''
+            Perform group mutation: every complete T-set is dissolved with given probability
+            and all free genes are repaired with first-fit greedy in random order
+            Params:
+                `probability`: (independent) probability of a set being dissolved
+            '''
+            groups = [g for g in self.get_groups() if self._solver.rng.uniform(0, 1) > probability]
+            taken = [False] * self._solver._n
+            for group in groups:
+                for i in group:
+                    taken[i] = True
+
+            free = [i for i in range(self._solver._n) if not taken[i]]
+            self._solver.rng.shuffle(free)
+
+            ind = GeneticSolver.Individual.from_groups(groups, free, self._solver)
+            self.solution, self.num_leftovers, self.num_sets, self.sums, self.fitness = ind.solution, ind.num_leftovers, ind.num_sets, ind.sums, ind.fitness
+
+        def get_groups(self) -> list:
+            '''Return gene indexes of every set that sums to T'''
+            groups = [[] for _ in range(self.num_sets)]
+            for i, v in enumerate(self.solution):
+                if v > 0 and self.sums[v - 1] == self._solver.T:
+                    groups[v - 1].append(i)
+            return [g for g in groups if len(g) > 0]
+
+        @staticmethod
+        def from_groups(groups: list, free: list, solver: 'GeneticSolver') -> 'GeneticSolver.Individual':
+            '''
+            Build individual from gene index groups that sum to T, free genes are placed by first-fit greedy in given order.
+            Greedy sets that do not reach T are turned into leftovers, so every set of the individual sums to T
+            Params:
+                `groups`: lists of gene indexes, each summing to T
+                `free`: gene indexes not in any group
+                `solver`: GeneticSolver instance to which the individual belongs
+            '''
+            T = solver.T
+            open_groups = []
+            open_sums = []
+            for i in free:
+                el = solver.problem[i]
+                for k in range(len(open_groups)):
+                    if open_sums[k] < T and open_sums[k] + el <= T:
+                        open_groups[k].append(i)
+                        open_sums[k] += el
+                        break
+                else:
+                    open_groups.append([i])
+                    open_sums.append(el)
+
+            groups = groups + [g for g, s in zip(open_groups, open_sums) if s == T]
+
+            solution = [0] * solver._n
+            for k, group in enumerate(groups, 1):
+                for i in group:
+                    solution[i] = k
+
+            ind = GeneticSolver.Individual(solution, solver)
+            ind.num_sets = len(groups)
+            ind.sums = [T] * len(groups)
+            ind.num_leftovers = solver._n - sum([len(g) for g in groups])
+            ind.fitness = solver.get_fitness(ind)
+            return ind
+
         def mutate(self, probability: float = 0.01) -> None:
             '''
             Perform random mutation on this individual's chromosome
@@ -49,10 +142,10 @@ class GeneticSolver:
                 `probability`: (independent) probability of a gene changing
             '''
             for i in range(self._solver._n):
-                if random.uniform(0, 1) > probability:
+                if self._solver.rng.uniform(0, 1) > probability:
                     continue
 
-                rs = random.randint(0, self._solver._n)
+                rs = self._solver.rng.randint(0, self._solver._n)
 
                 if rs > self.num_sets:
                     self.num_sets += 1
@@ -68,10 +161,10 @@ class GeneticSolver:
                 `probability`: (independent) probability of a gene initiating a change
             '''
             for i in range(self._solver._n):
-                if random.uniform(0, 1) > probability:
+                if self._solver.rng.uniform(0, 1) > probability:
                     continue
 
-                j = random.randrange(i, self._solver._n)
+                j = self._solver.rng.randrange(i, self._solver._n)
                 
                 self.solution[i], self.solution[j] = self.solution[j], self.solution[i]
 
@@ -188,7 +281,20 @@ class GeneticSolver:
             leftover_weight: float = 0.01,
             patience: int = 50,
             log_interval: int = 50,
-            silent: bool = False) -> None:
+            silent: bool = False,
+            rng: random.Random = None,
+            profile_path: str = None,
+            early_stop: bool = True,
+            crossover: str = 'uniform',
+            reach: int = None) -> None:
+        # 'uniform': gene-wise crossover with random and swap mutation
+        # 'group': group-preserving crossover and set-dissolving mutation, both with greedy repair
+        # `reach` is optional precomputed `bounds.reachable_sums` of the problem (or of a superset of it), used by the lower bound only
+        assert crossover in ('uniform', 'group')
+        self.crossover = crossover
+        self.rng = make_rng(rng)
+        self.profile_path = profile_path
+        self.profiler = PhaseProfiler(evaluation_phase='cross' if crossover == 'group' else 'recalculate')
         self.problem = problem
         self.T = T
         self.pop_size = pop_size
@@ -206,6 +312,8 @@ class GeneticSolver:
 
         self._early_stop_counter = 0
         self.patience = patience
+        self.early_stop = early_stop
+        self.lower_bound = lower_bound_leftovers(problem, T, reach=reach)
 
         self._n = len(problem)
         self._mean = mean(problem)
@@ -221,10 +329,17 @@ class GeneticSolver:
         self.population += [self._random_individual() for _ in range(pop_size - len(self.population))]
         self.population.sort(key=lambda x: x.fitness, reverse=True)
         self.total_fitness = sum([sln.fitness for sln in self.population])
+        for sln in self.population:
+            self._update_best_viable(sln)
 
         self._logger.log_initial(self)
 
     def run(self, generations: int) -> None:
+        with cprofile_export(self.profile_path), self.profiler.run():
+            self._run(generations)
+
+    def _run(self, generations: int) -> None:
+        profiler = self.profiler
         with tqdm(range(generations), postfix={'best': self.population[0].fitness}, disable=self.silent) as progress_bar:
             for gen in progress_bar:
                 self._early_stop_counter += 1
@@ -232,11 +347,17 @@ class GeneticSolver:
                     print("Early stopping triggered on generation", gen)
                     break
 
+                if self.is_optimal():
+                    if not self.silent:
+                        print("Lower bound on leftovers reached on generation", gen)
+                    break
+
                 #  select parents
+                t = profiler.start()
                 mating_pool = []
 
                 step = self.total_fitness / self.pop_size
-                cur_selection_point = random.uniform(0, step)            
+                cur_selection_point = self.rng.uniform(0, step)            
                 total_visited = 0
                 for sln in self.population:
                     if total_visited + sln.fitness >= cur_selection_point:
@@ -251,35 +372,45 @@ class GeneticSolver:
                 assert len(new_generation) <= self.elite_size
                 
                 self.total_fitness = sum([sln.fitness for sln in new_generation])
+                profiler.stop('selection', t, self.pop_size)
 
                 # crossover and generate new population
                 for _ in range(self.pop_size - len(new_generation)):
-                    a = random.choice(mating_pool)
-                    b = random.choice(mating_pool)
+                    t = profiler.start()
+                    a = self.rng.choice(mating_pool)
+                    b = self.rng.choice(mating_pool)
                     while a is b:
                         if len(mating_pool) < 2:
                             break
 
-                        b = random.choice(mating_pool)
+                        b = self.rng.choice(mating_pool)
                     
-                    child = a.cross(b)
-                    child.mutate(self.mutation_rate)
-                    child.swap_mutate(self.swap_mutation_rate)
-                    child.recalculate()
+                    if self.crossover == 'group':
+                        child = a.group_cross(b)
+                        t = profiler.stop('cross', t, self._n)
+                        child.group_mutate(self.mutation_rate)
+                        profiler.stop('mutate', t, self._n)
+                    else:
+                        child = a.cross(b)
+                        t = profiler.stop('cross', t, self._n)
+                        child.mutate(self.mutation_rate)
+                        t = profiler.stop('mutate', t, self._n)
+                        child.swap_mutate(self.swap_mutation_rate)
+                        t = profiler.stop('swap_mutate', t, self._n)
+                        child.recalculate()
+                        profiler.stop('recalculate', t, self._n)
                     self.total_fitness += child.fitness
                     new_generation.append(child)
 
-                    if child.fitness > self._best_viable.fitness:
-                        for s in child.sums:
-                            if s != 0 and s != self.T:
-                                break
-                        else:
-                            self._best_viable = child
+                    self._update_best_viable(child)
                 
                 old_best = self.population[0].fitness
 
+                t = profiler.start()
                 self.population = new_generation
                 self.population.sort(key=lambda x: x.fitness, reverse=True)
+                profiler.stop('sort', t, self.pop_size)
+                profiler.count('generations')
                 
                 if self.population[0].fitness > old_best:
                     self._early_stop_counter = 0
@@ -295,6 +426,25 @@ class GeneticSolver:
         self._logger.log_solution("best", self.population[0])
         self._logger.log_solution("best_viable", self._best_viable)
 
+    def _update_best_viable(self, individual: 'Individual') -> None:
+        '''Save individual as best viable if all its sets sum to T and it is fitter than the current one'''
+        if individual.fitness > self._best_viable.fitness:
+            for s in individual.sums:
+                if s != 0 and s != self.T:
+                    break
+            else:
+                self._best_viable = individual
+
+    def is_optimal(self) -> bool:
+        '''Check whether best viable solution meets the lower bound on leftovers'''
+        return self.early_stop and self._best_viable._solver != None and self._best_viable.num_leftovers <= self.lower_bound
+
+    def get_optimality_gap(self) -> float:
+        '''Difference between leftover ratio of best viable solution and the lower bound on it. None if no viable solution was found'''
+        if self._best_viable._solver == None:
+            return None
+        return optimality_gap(self._best_viable.num_leftovers, self.lower_bound, self._n)
+
     def get_fitness(self, individual: Individual) -> float:
         return 1 / (1 + sum(map(lambda x: (abs(self.T - x) / self._stdev) ** 2, individual.sums))
                      + self.leftover_weight * individual.num_leftovers / self._n)
@@ -313,19 +463,34 @@ class GeneticSolver:
                 res[v - 1].append(self.problem[i])
 
         return [x for x in res if x != []]
+
+    def get_leftovers(self, n: int = 0) -> list:
+        '''
+        Returns elements not assigned to any set in n-th best solution
+        Params:
+            `n`: index of solution to return. 0 is best overall.
+        '''
+        return [self.problem[i] for i, v in enumerate(self.population[n].solution) if v == 0]
     
     def get_result_dict(self, mode: str = 'ims') -> dict:
-        return self._logger.get_dict(mode)
+        result = self._logger.get_dict(mode)
+        result['profile'] = self.profiler.get_dict()
+        result['optimality_gap'] = self.get_optimality_gap()
+        return result
     
     def get_parameters(self) -> dict:
-        return self._logger.initial
+        '''Initial log without the problem, which results already carry'''
+        params = {k: v for k, v in self._logger.initial.items() if k != 'problem'}
+        params['profile'] = self.profiler.get_dict()
+        params['optimality_gap'] = self.get_optimality_gap()
+        return params
 
     def _random_individual(self) -> 'Individual':
-        max_n_sets = random.randint(1, self._n)
+        max_n_sets = self.rng.randint(1, self._n)
         s = [0] * self._n
         n_sets = 0
         for i in range(self._n):
-            rs = random.randint(0, max_n_sets)
+            rs = self.rng.randint(0, max_n_sets)
 
             if rs > n_sets:
                 n_sets += 1
@@ -450,6 +615,28 @@ if __name__=='__main__':
         metavar="MODE"
     )
 
+    parser.add_argument('--seed',
+        type=int,
+        default=None,
+        dest="seed",
+        help="Seed of the random number generator shared by problem generator and solvers"
+    )
+
+    parser.add_argument('-c', '--crossover',
+        type=str,
+        default='uniform',
+        choices=['uniform', 'group'],
+        dest="crossover",
+        help="Gene-wise uniform crossover or group-preserving crossover with greedy repair"
+    )
+    parser.add_argument('--profile',
+        type=str,
+        default=None,
+        dest="profile",
+        help="Dump cProfile stats of the run to PATH",
+        metavar="PATH"
+    )
+
     parser.add_argument('-i', '--init', '--initial_population',
         nargs="*",
         default=[],
@@ -459,8 +646,9 @@ if __name__=='__main__':
 
     args = parser.parse_args()
 
-    gen = Generator()
-    greedy = GreedySolver(verbose=False)
+    rng = make_rng(args.seed)
+    gen = Generator(rng)
+    greedy = GreedySolver(verbose=False, rng=rng)
 
     problem = gen.generate_random_set(
         args.generator_size,
@@ -480,7 +668,8 @@ if __name__=='__main__':
                 problem=problem,
                 T=args.T,
                 RCL_count=int(tokens[2]) if len(tokens) > 2 else 20,
-                dropout_rate=float(tokens[3]) if len(tokens) > 3 else 0.5
+                dropout_rate=float(tokens[3]) if len(tokens) > 3 else 0.5,
+                rng=rng
             )
             grasp.perform_GRASP(int(tokens[1]) if len(tokens) > 1 else 100)
 
@@ -494,7 +683,10 @@ if __name__=='__main__':
         elitism_ratio=args.elitism,
         mutation_rate=args.mr,
         swap_mutation_rate=args.smr,
-        leftover_weight=args.lw
+        leftover_weight=args.lw,
+        rng=rng,
+        profile_path=args.profile,
+        crossover=args.crossover
     )
 
     gs.run(args.generations)
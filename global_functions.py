@@ -1,7 +1,24 @@
 from typing import List, Tuple
 import random
+import numpy as np
 
 
+def make_rng(seed=None) -> random.Random:
+    '''Create random number generator from seed. Already created generator is returned as is.'''
+    if isinstance(seed, random.Random):
+        return seed
+    return random.Random(seed)
+
+def spawn_seeds(rng: random.Random, n: int) -> List[int]:
+    '''Derive n independent seeds from generator, e.g. one for every worker process.\n
+    Seeds are spawned with numpy SeedSequence, so streams of workers do not overlap.'''
+    children = np.random.SeedSequence(rng.getrandbits(128)).spawn(n)
+    return [int.from_bytes(child.generate_state(4).tobytes(), 'little') for child in children]
+
+def split_rng(rng: random.Random, n: int) -> List[random.Random]:
+    '''Split generator into n independent generators.'''
+    return [random.Random(seed) for seed in spawn_seeds(rng, n)]
+
 def create_all_posible_subsets_from_set(set) -> Tuple[int, List[List[int]]]:
     '''Generate all (non-empty) possible subsets for a given set.\n
     Retrun number of subsets, list of subsets.'''
@@ -33,6 +50,17 @@ def filter_sets_by_sum_T(list_of_sets, T) -> List[List[int]]:
     '''Filter list of sets to leave only those who sum up to T.'''
     return list(filter(lambda x: sum(x) == T ,list_of_sets))
 
+def split_sets_by_sum_T(list_of_sets, T) -> Tuple[List[List[int]], List[int]]:
+    '''Split list of sets into those who sum up to T and leftovers made of all the other elements.'''
+    valid = list()
+    leftovers = list()
+    for set in list_of_sets:
+        if sum(set) == T:
+            valid.append(set)
+        else:
+            leftovers += set
+    return valid, leftovers
+
 def calculate_penalty(T:int, list_of_sets:list, leftovers:list, penalty_magnitude:int=1) -> float:
     '''Calculate penalty for solution given T, subsets, leftovers. \n
     At the moment, penalty is number of leftovers*penalty_magnitude / number of items in subsets '''
@@ -4,9 +4,7 @@ from typing import List, Tuple
 from generator import Generator
 import random
 import numpy as np
-import time
-
-random.seed(time.time())
+from global_functions import make_rng
 
 
 class Pair:
@@ -14,27 +12,55 @@ class Pair:
         self.elements = []
         self.sum = 0
 
+class PairGroup:
+    '''Identical greedy sets stored once. `elements` is a list of (value, copies) in order of placement, `count` is the number of such sets'''
+    def __init__(self, elements: list = None, sum: int = 0, count: int = 1) -> None:
+        self.elements = elements if elements != None else []
+        self.sum = sum
+        self.count = count
+
+    def copy(self, count: int) -> 'PairGroup':
+        return PairGroup(list(self.elements), self.sum, count)
+
+    def size(self) -> int:
+        '''Number of elements in a single set of the group'''
+        return sum([copies for _, copies in self.elements])
+
+    def expand(self) -> List[List[int]]:
+        '''Return explicit sets of the group'''
+        elements = list()
+        for value, copies in self.elements:
+            elements += [value] * copies
+        return [list(elements) for _ in range(self.count)]
+
 class GreedySolver:
     '''Greedy solver running in O(n^2) time.'''
 
-    def __init__(self, verbose:bool=True) -> None:
+    def __init__(self, verbose:bool=True, rng:random.Random=None) -> None:
+        '''
+        Params:
+            `verbose`: flag to indicate whether solution should be printed
+            `rng`: random number generator or seed used by the 'rand' order
+        '''
         self.verbose = verbose
+        self.rng = make_rng(rng)
 
     def greedy_solution(self, start_set:list, T:int, list_order:str='desc') -> Tuple[List[List[int]], List[int], float]:
-        '''Generate basic greedy solution in O(n^2) time.\n
+        '''Generate basic greedy solution in O(n^2) time. `start_set` is not modified.\n
         Return: \n
         Solution: List of solution sets\n
         Leftovers: List of leftovers\n
         Penalty: Quailty measure of solution'''
         solution_pretenders= list()
 
-        #Apply selected order to list
+        #Apply selected order to a copy, already sorted input is sorted in linear time
         if list_order == 'desc':
-            start_set.sort(reverse=True)
+            start_set = sorted(start_set, reverse=True)
         elif list_order == 'asc':
-            start_set.sort()
+            start_set = sorted(start_set)
         elif list_order == 'rand':
-            random.shuffle(start_set)
+            start_set = list(start_set)
+            self.rng.shuffle(start_set)
 
         #Build solution by greedy approach
         for el in start_set:
@@ -47,7 +73,10 @@ class GreedySolver:
                     found = True
                     break
             if found == False:
-                solution_pretenders.append(Pair())
+                pretender = Pair()
+                pretender.elements.append(el)
+                pretender.sum += el
+                solution_pretenders.append(pretender)
                 
         #Gather solution and leftovers from built structure
         solution = list()    
@@ -71,16 +100,107 @@ class GreedySolver:
 
         return solution, leftovers, penalty
 
+    def greedy_histogram_groups(self, histogram:dict, T:int, list_order:str='desc') -> Tuple[List[PairGroup], List[PairGroup], float]:
+        '''Greedy solution of problem given as value -> count histogram. Placement is the same first-fit as in `greedy_solution`,
+        but all copies of a value are placed at once and identical sets are kept as one group, so run time and memory depend on the number of distinct values.
+        Order 'rand' shuffles distinct values.\n
+        Return: \n
+        Solution: List of groups of sets summing to T\n
+        Leftovers: List of groups of the other sets\n
+        Penalty: Quailty measure of solution'''
+        values = [v for v in histogram if histogram[v] > 0]
+        if list_order == 'desc':
+            values.sort(reverse=True)
+        elif list_order == 'asc':
+            values.sort()
+        elif list_order == 'rand':
+            self.rng.shuffle(values)
+
+        groups = list()
+        for v in values:
+            c = histogram[v]
+
+            #First fit into existing groups, group that takes only part of the copies is split
+            i = 0
+            limit = T - v
+            while i < len(groups):
+                group = groups[i]
+                if group.sum >= T or group.sum > limit:
+                    i += 1
+                    continue
+                fit = c if v <= 0 else min(c, (T - group.sum) // v)
+
+                #Common case of a single set taking all copies is updated in place
+                if group.count == 1 and fit == c:
+                    group.elements.append((v, c))
+                    group.sum += v * c
+                    c = 0
+                    break
+
+                full = min(group.count, c // fit)
+                rest = c - full * fit if full < group.count else 0
+                split = list()
+                if full > 0:
+                    split.append(PairGroup(group.elements + [(v, fit)], group.sum + v * fit, full))
+                if rest > 0:
+                    split.append(PairGroup(group.elements + [(v, rest)], group.sum + v * rest, 1))
+                untouched = group.count - full - (1 if rest > 0 else 0)
+                if untouched > 0:
+                    split.append(group.copy(untouched))
+
+                groups[i:i + 1] = split
+                c -= full * fit + rest
+                i += len(split)
+                if c == 0:
+                    break
+
+            #Remaining copies open new sets
+            if c > 0:
+                fit = min(c, 1 + self.__copies_that_fit(v, v, T, c - 1))
+                groups.append(PairGroup([(v, fit)], v * fit, c // fit))
+                if c % fit > 0:
+                    groups.append(PairGroup([(v, c % fit)], v * (c % fit), 1))
+
+        solution = [g for g in groups if g.sum == T]
+        leftovers = [g for g in groups if g.sum != T]
+        leftover_count = sum([g.size() * g.count for g in leftovers])
+        penalty = leftover_count / max(0.0001, sum([histogram[v] for v in values]))
+        return solution, leftovers, penalty
+
+    def __copies_that_fit(self, s:int, v:int, T:int, c:int) -> int:
+        '''Number of copies of value v (at most c) that fit set with sum s'''
+        if s >= T:
+            return 0
+        if v <= 0:
+            return c
+        return min(c, (T - s) // v)
+
+    def greedy_histogram_solution(self, histogram:dict, T:int, list_order:str='desc') -> Tuple[List[List[int]], List[int], float]:
+        '''Run `greedy_histogram_groups` and expand groups to explicit sets.\n
+        Return: \n
+        Solution: List of solution sets\n
+        Leftovers: List of leftovers\n
+        Penalty: Quailty measure of solution'''
+        groups, leftover_groups, penalty = self.greedy_histogram_groups(histogram, T, list_order)
+        solution = [s for g in groups for s in g.expand()]
+        leftovers = [el for g in leftover_groups for s in g.expand() for el in s]
+
+        if self.verbose == True:
+            print(f'Solution penalty {penalty:.2f}\nhistogram approach {list_order}\n{len(solution)} subsets, {len(leftovers)} leftovers\n')
+
+        return solution, leftovers, penalty
+
 
 if __name__ == '__main__':
-    T = random.randint(350, 400)
-    generator = Generator()
+    rng = make_rng()
+    T = rng.randint(350, 400)
+    generator = Generator(rng)
     #set = generator.generate_proceural_guaranteed_solution(T)
     set = generator.generate_random_set(100, 0, 200)
     print(f'Generated set {set}')
 
     compare = ['asc', 'desc', 'rand']
-    greedySolver = GreedySolver() 
+    greedySolver = GreedySolver(rng=rng) 
 
     for order in compare:
         solution, leftovers, penalty = greedySolver.greedy_solution(set, T, list_order=order)
@@ -0,0 +1,149 @@
+from bisect import bisect_left, insort
+from typing import Dict, List
+from greedy_solver import Pair
+from GRASP import GRASP
+from global_functions import calculate_penalty, make_rng
+import random
+import sys
+
+
+class OnlineSolver:
+    '''Online solver for streaming element arrivals. Completed T-sets are emitted as soon as they are found.'''
+
+    def __init__(self, T: int, max_set_size: int = 50, repair_interval: int = 0, repair_iterations: int = 10, RCL_count: int = 20, verbose: bool = False, rng: random.Random = None) -> None:
+        '''
+        Create online solver.
+        Params:
+            `T`: number to which all the sets should sum up
+            `max_set_size`: maximal number of elements held by an open set. Full sets that do not sum to T are moved to the repair pool
+            `repair_interval`: number of insertions between GRASP repairs of the open pool. 0 disables automatic repair
+            `repair_iterations`: number of GRASP iterations performed by a single repair
+            `RCL_count`: number of candidate searches performed in each repair iteration
+            `verbose`: flag to indicate whether there should be any debug output
+            `rng`: random number generator or seed used by repairs
+        '''
+        self.rng = make_rng(rng)
+        self.T = T
+        self.max_set_size = max_set_size
+        self.repair_interval = repair_interval
+        self.repair_iterations = repair_iterations
+        self.RCLs_count = RCL_count
+        self.verbose = verbose
+
+        #Open sets indexed by their residual (T - sum), residuals are kept sorted for best-fit lookup
+        self.open_sets: Dict[int, List[Pair]] = dict()
+        self.residuals = list()
+        self.pool = list()
+        self.unusable = list()
+        self.completed = list()
+        self.inserted_since_repair = 0
+
+    def add(self, el: int) -> List[List[int]]:
+        '''Insert single element.\n
+        Return list of T-sets completed by this insertion.'''
+        emitted = self.__place(el)
+        self.completed += emitted
+        self.inserted_since_repair += 1
+
+        if self.repair_interval > 0 and self.inserted_since_repair >= self.repair_interval:
+            emitted += self.repair()
+
+        return emitted
+
+    def add_batch(self, elements: list) -> List[List[int]]:
+        '''Insert batch of elements, largest first.\n
+        Return list of T-sets completed by this batch.'''
+        emitted = list()
+        for el in sorted(elements, reverse=True):
+            emitted += self.add(el)
+        return emitted
+
+    def repair(self) -> List[List[int]]:
+        '''Run GRASP over all elements of open sets and the repair pool, rebuild open sets from its leftovers.\n
+        Return list of T-sets found by the repair.'''
+        self.inserted_since_repair = 0
+        elements = self.get_open_elements()
+        if len(elements) == 0:
+            return list()
+
+        grasp = GRASP(problem=elements, T=self.T, RCL_count=self.RCLs_count, rng=self.rng)
+        grasp.perform_GRASP(self.repair_iterations)
+        emitted = [list(s) for s in grasp.get_best_achieved_solution()]
+
+        self.open_sets = dict()
+        self.residuals = list()
+        self.pool = list()
+        for el in sorted(grasp.get_best_achieved_leftovers(), reverse=True):
+            emitted += self.__place(el)
+
+        self.completed += emitted
+        self.debug_message(f'Repair: {len(emitted)} sets emitted, {len(self.get_open_elements())} elements still open')
+        return emitted
+
+    def __place(self, el: int) -> List[List[int]]:
+        '''Best-fit placement of element into the open set with the smallest residual that can take it.'''
+        assert el >= 0, 'Online solver supports only non-negative elements'
+
+        if el > self.T:
+            self.unusable.append(el)
+            return list()
+
+        idx = bisect_left(self.residuals, el)
+        if idx < len(self.residuals):
+            residual = self.residuals[idx]
+            pretender = self.open_sets[residual].pop()
+            if len(self.open_sets[residual]) == 0:
+                del self.open_sets[residual]
+                self.residuals.pop(idx)
+        else:
+            pretender = Pair()
+
+        pretender.elements.append(el)
+        pretender.sum += el
+
+        if pretender.sum == self.T:
+            return [pretender.elements]
+
+        if len(pretender.elements) >= self.max_set_size:
+            self.pool += pretender.elements
+            return list()
+
+        residual = self.T - pretender.sum
+        if residual not in self.open_sets:
+            self.open_sets[residual] = list()
+            insort(self.residuals, residual)
+        self.open_sets[residual].append(pretender)
+
+        return list()
+
+    def get_open_elements(self) -> List[int]:
+        '''Return all elements that are not part of any emitted T-set, except those that can never be used.'''
+        elements = list(self.pool)
+        for pretenders in self.open_sets.values():
+            for pretender in pretenders:
+                elements += pretender.elements
+        return elements
+
+    def debug_message(self, message) -> None:
+        '''Print message'''
+        if self.verbose:
+            print(message, file=sys.stderr)
+
+    def get_solution(self) -> List[List[int]]:
+        return self.completed
+
+    def get_leftovers(self) -> List[int]:
+        return self.get_open_elements() + self.unusable
+
+    def get_solution_penalty(self) -> float:
+        return calculate_penalty(self.T, self.completed, self.get_leftovers())
+
+
+if __name__ == '__main__':
+    rng = make_rng()
+    online = OnlineSolver(T=300, repair_interval=200, verbose=True, rng=rng)
+    for _ in range(1000):
+        online.add(rng.randint(0, 200))
+    online.repair()
+
+    print(f'{len(online.get_solution())} sets emitted, {len(online.get_leftovers())} leftovers, score {online.get_solution_penalty():.3f}')
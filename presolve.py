@@ -0,0 +1,116 @@
+from collections import Counter
+from typing import List, Tuple
+from global_functions import calculate_penalty
+
+
+class Presolver:
+    '''Presolve reduction stage. Strips the trivial part of a problem before any solver runs.'''
+
+    def __init__(self, T: int, pairs: bool = False) -> None:
+        '''
+        Create presolver.
+        Params:
+            `T`: number to which all the sets should sum up
+            `pairs`: flag to indicate whether complementary pairs should be emitted as T-sets. This is a heuristic, committing a pair can make the optimum unreachable
+                (T=10 on [7, 3, 3, 4]: pair 7+3 leaves 2 leftovers, {3, 3, 4} only 1). Elements above T, elements equal to T and zeros are always reduced, these reductions are exact
+        '''
+        self.T = T
+        self.pairs = pairs
+        self.sets = list()
+        self.unusable = list()
+        self.zeros = list()
+        self.pair_count = 0
+
+    def presolve(self, problem: list, histogram: Counter = None) -> List[int]:
+        '''Remove unusable elements, emit singleton (and with `pairs` complementary pair) T-sets by hash lookups.
+        `histogram` is optional precomputed value count of the problem, e.g. shared across many T values.\n
+        Return reduced core that should be handed to a solver.'''
+        counts = self.presolve_histogram(histogram if histogram != None else Counter(problem))
+
+        #Keep original order of the remaining elements
+        core = list()
+        for el in problem:
+            if counts[el] > 0:
+                core.append(el)
+                counts[el] -= 1
+
+        return core
+
+    def presolve_histogram(self, histogram: Counter) -> Counter:
+        '''Same reduction as `presolve` on value -> count histogram, without expanding the problem.\n
+        Return value counts of the reduced core.'''
+        self.sets = list()
+        self.unusable = list()
+        self.zeros = list()
+        self.pair_count = 0
+
+        #Negative values can complete any set, nothing can be proven about them
+        counts = Counter({el: cnt for el, cnt in histogram.items() if cnt > 0})
+        if len(counts) == 0 or min(counts) < 0 or self.T <= 0:
+            return counts
+
+        for el in list(counts):
+            if el > self.T:
+                self.unusable += [el] * counts[el]
+            elif el == self.T:
+                self.sets += [[el] for _ in range(counts[el])]
+            elif el == 0:
+                self.zeros += [el] * counts[el]
+            else:
+                continue
+            del counts[el]
+
+        if self.pairs:
+            for el in sorted(counts, reverse=True):
+                complement = self.T - el
+                if complement > el or counts[el] == 0:
+                    continue
+
+                if complement == el:
+                    pair_count = counts[el] // 2
+                else:
+                    pair_count = min(counts[el], counts[complement])
+
+                if pair_count > 0:
+                    self.pair_count += pair_count
+                    self.sets += [[el, complement] for _ in range(pair_count)]
+                    counts[el] -= pair_count
+                    counts[complement] -= pair_count
+
+        return +counts
+
+    def is_exact(self) -> bool:
+        '''Check whether the last reduction kept the optimum reachable, i.e. no complementary pair was committed.
+        Only then bounds proven for the core hold for the original problem.'''
+        return self.pair_count == 0
+
+    def merge(self, solution: List[List[int]], leftovers: List[int]) -> Tuple[List[List[int]], List[int], float]:
+        '''Merge solution of the reduced core with presolved sets. Zeros are attached to any T-set.\n
+        Return: \n
+        Solution: List of solution sets\n
+        Leftovers: List of leftovers\n
+        Penalty: Quailty measure of solution'''
+        merged_solution = [list(s) for s in self.sets] + [list(s) for s in solution]
+        merged_leftovers = list(leftovers) + self.unusable
+
+        if len(merged_solution) > 0:
+            merged_solution[0] += self.zeros
+        else:
+            merged_leftovers += self.zeros
+
+        return merged_solution, merged_leftovers, calculate_penalty(self.T, merged_solution, merged_leftovers)
+
+    def get_reduction_stats(self, problem_size: int) -> dict:
+        return {
+            'presolved_sets': len(self.sets),
+            'unusable': len(self.unusable),
+            'zeros': len(self.zeros),
+            'core_size': problem_size - sum([len(s) for s in self.sets]) - len(self.unusable) - len(self.zeros)
+        }
+
+
+if __name__ == '__main__':
+    presolver = Presolver(10, pairs=True)
+    core = presolver.presolve([1, 9, 2, 8, 3, 7, 4, 6, 10, 12, 0, 5, 5, 5])
+    print(f'Presolved sets: {presolver.sets}\nCore: {core}\nUnusable: {presolver.unusable}')
+    print(presolver.merge([], core))
@@ -0,0 +1,76 @@
+from collections import defaultdict
+from contextlib import contextmanager
+import cProfile
+import time
+
+
+class PhaseProfiler:
+    '''Low-overhead per-phase timers and counters. Phases are timed with perf_counter_ns start/stop pairs.'''
+
+    def __init__(self, evaluation_phase: str = None) -> None:
+        '''
+        Params:
+            `evaluation_phase`: name of the phase that evaluates solutions, used to report evaluations per second
+        '''
+        self.evaluation_phase = evaluation_phase
+        self.times = defaultdict(int)
+        self.calls = defaultdict(int)
+        self.elements = defaultdict(int)
+        self.counters = defaultdict(int)
+        self.total_time = 0
+
+    def start(self) -> int:
+        '''Return timestamp to be passed to `stop`'''
+        return time.perf_counter_ns()
+
+    def stop(self, phase: str, start: int, elements: int = 0) -> int:
+        '''Add time elapsed since `start` to the phase. Return new timestamp so phases can be chained.'''
+        now = time.perf_counter_ns()
+        self.times[phase] += now - start
+        self.calls[phase] += 1
+        self.elements[phase] += elements
+        return now
+
+    def count(self, counter: str, value: int = 1) -> None:
+        self.counters[counter] += value
+
+    @contextmanager
+    def run(self):
+        '''Measure total run time, which is the base for time shares and evaluation rate.'''
+        start = time.perf_counter_ns()
+        try:
+            yield self
+        finally:
+            self.total_time += time.perf_counter_ns() - start
+
+    def get_dict(self) -> dict:
+        phases = dict()
+        for phase, phase_time in self.times.items():
+            phases[phase] = {
+                'time_ns': phase_time,
+                'time_share': phase_time / max(1, self.total_time),
+                'calls': self.calls[phase],
+                'elements': self.elements[phase],
+                'calls_per_second': self.calls[phase] / max(1e-9, phase_time / 1e9)
+            }
+
+        result = {'total_time_ns': self.total_time, 'phases': phases, 'counters': dict(self.counters)}
+        if self.evaluation_phase != None:
+            result['evaluations_per_second'] = self.calls[self.evaluation_phase] / max(1e-9, self.total_time / 1e9)
+        return result
+
+
+@contextmanager
+def cprofile_export(path: str = None):
+    '''Run enclosed code under cProfile and dump stats to `path`. Does nothing if `path` is not provided.'''
+    if path == None:
+        yield None
+        return
+
+    profiler = cProfile.Profile()
+    profiler.enable()
+    try:
+        yield profiler
+    finally:
+        profiler.disable()
+        profiler.dump_stats(path)
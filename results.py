@@ -0,0 +1,157 @@
+from collections import defaultdict
+from typing import List, Tuple
+import argparse
+import hashlib
+import json
+import numpy as np
+
+OUTPUT_FORMATS = ['full', 'index', 'npz']
+
+
+def to_membership(problem: list, solution: List[List[int]]) -> List[int]:
+    '''Encode solution as membership vector over problem indexes (0 = leftover, k = set k), same as GeneticSolver.Individual.\n
+    Elements of the problem that are not a member of any solution set are leftovers.'''
+    indexes = defaultdict(list)
+    for i in range(len(problem) - 1, -1, -1):
+        indexes[problem[i]].append(i)
+
+    membership = [0] * len(problem)
+    for k, s in enumerate(solution, 1):
+        for el in s:
+            if len(indexes[el]) == 0:
+                raise ValueError(f'Solution set {k} uses value {el} more times than it appears in the problem')
+            membership[indexes[el].pop()] = k
+    return membership
+
+
+def from_membership(problem: list, membership: List[int]) -> Tuple[List[List[int]], List[int]]:
+    '''Decode membership vector into solution sets and leftovers.'''
+    if len(problem) != len(membership):
+        raise ValueError(f'Membership vector has {len(membership)} entries, problem has {len(problem)} elements')
+
+    sets = defaultdict(list)
+    leftovers = list()
+    for el, k in zip(problem, membership):
+        if k == 0:
+            leftovers.append(el)
+        else:
+            sets[k].append(el)
+    return [sets[k] for k in sorted(sets)], leftovers
+
+
+def problem_hash(problem: list) -> str:
+    '''Short fingerprint of the problem, compact formats store it to detect problems changed after the results were written'''
+    return hashlib.sha1(np.asarray(problem, dtype=np.int64).tobytes()).hexdigest()[:16]
+
+
+def write_results(path: str, results: List[dict], parameters: dict, output_format: str = 'full', source: str = None) -> None:
+    '''
+    Save results of solve.py.
+    Params:
+        `results`: result dicts with problem, T, solution and leftovers
+        `parameters`: parameters dict stored along results
+        `output_format`: 'full' writes value lists and echoes problems, 'index' writes json with membership vectors only,
+            'npz' writes membership vectors into compressed numpy archive
+        `source`: path of the problems file, recorded in compact formats so that the reader can find problems
+    '''
+    if output_format == 'full':
+        with open(path, 'w') as f:
+            json.dump({'results': results, 'parameters': parameters}, f)
+        return
+
+    #Compact formats never store problems, not even echoed in solver parameters
+    parameters = {k: v for k, v in parameters.items() if k != 'problem'}
+    memberships = [to_membership(r['problem'], r['solution']) for r in results]
+    if output_format == 'index':
+        with open(path, 'w') as f:
+            json.dump({
+                'format': 'index',
+                'source': source,
+                'results': [{'T': r['T'], 'hash': problem_hash(r['problem']), 'membership': m} for r, m in zip(results, memberships)],
+                'parameters': parameters
+            }, f, separators=(',', ':'))
+    elif output_format == 'npz':
+        #All vectors in a single array of the narrowest type, offsets mark where every result starts
+        flat = np.concatenate([np.asarray(m, dtype=np.int64) for m in memberships]) if len(memberships) > 0 else np.zeros(0, dtype=np.int64)
+        dtype = np.min_scalar_type(int(flat.max())) if len(flat) > 0 else np.uint8
+        np.savez_compressed(
+            path,
+            T=np.asarray([r['T'] for r in results], dtype=np.int64),
+            offsets=np.cumsum([0] + [len(m) for m in memberships], dtype=np.int64),
+            membership=flat.astype(dtype),
+            hashes=np.array([problem_hash(r['problem']) for r in results], dtype=str),
+            parameters=np.array(json.dumps(parameters)),
+            source=np.array(source if source != None else '')
+        )
+    else:
+        raise ValueError(f'Unknown output format {output_format}, expected one of {OUTPUT_FORMATS}')
+
+
+def read_results(path: str, problems: List[list] = None, strict: bool = True) -> Tuple[List[dict], dict]:
+    '''Load results written by `write_results` in any format and reconstruct value view.\n
+    Compact formats do not store problems, they are taken from `problems` or from the source file recorded in the results.
+    Problems are checked against the stored fingerprints. A changed problem or a different number of problems is an error,
+    unless `strict` is False: then the membership of a changed problem is applied by position to its current elements and the result
+    is marked 'stale' (its sets are not guaranteed to sum to T), and only problems present in both are returned.\n
+    Return list of result dicts, parameters dict.'''
+    if path.endswith('.npz'):
+        with np.load(path, allow_pickle=False) as archive:
+            Ts = archive['T'].tolist()
+            offsets = archive['offsets'].tolist()
+            flat = archive['membership'].tolist()
+            hashes = archive['hashes'].tolist() if 'hashes' in archive.files else [None] * len(Ts)
+            parameters = json.loads(str(archive['parameters']))
+            source = str(archive['source'])
+        entries = [{'T': T, 'hash': hashes[i], 'membership': flat[offsets[i]:offsets[i + 1]]} for i, T in enumerate(Ts)]
+    else:
+        with open(path) as f:
+            dic = json.load(f)
+        if dic.get('format') != 'index':
+            return dic['results'], dic['parameters']
+        entries = dic['results']
+        parameters = dic['parameters']
+        source = dic.get('source')
+
+    if problems == None:
+        if not source:
+            raise ValueError(f'{path} does not record its problems file, pass problems explicitly')
+        with open(source) as f:
+            problems = [element['S'] for element in json.load(f)['problems']]
+
+    if strict and len(problems) != len(entries):
+        raise ValueError(f'{path} has {len(entries)} results, problems file has {len(problems)} problems')
+
+    results = list()
+    for i, (problem, entry) in enumerate(zip(problems, entries)):
+        membership = entry['membership']
+        changed = entry.get('hash') != None and entry['hash'] != problem_hash(problem) or len(membership) != len(problem)
+        if changed and strict:
+            raise ValueError(f'Problem {i} changed since {path} was written, pass the original problems')
+
+        if changed:
+            n = min(len(problem), len(membership))
+            solution, leftovers = from_membership(problem[:n], membership[:n])
+        else:
+            solution, leftovers = from_membership(problem, membership)
+        result = {'problem': problem, 'T': entry['T'], 'solution': solution, 'leftovers': leftovers}
+        if changed:
+            result['stale'] = True
+        results.append(result)
+    return results, parameters
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Convert compact results of solve.py back to full value lists")
+    parser.add_argument('results_name', help="Results file written with --output-format index or npz")
+    parser.add_argument('output_name', help="Json file for full results")
+    parser.add_argument('--problems', default=None, help="Problems file, by default the source recorded in results")
+    args = parser.parse_args()
+
+    problems = None
+    if args.problems != None:
+        with open(args.problems) as f:
+            problems = [element['S'] for element in json.load(f)['problems']]
+
+    results, parameters = read_results(args.results_name, problems)
+    write_results(args.output_name, results, parameters)
+    print(f'Saved {len(results)} results')
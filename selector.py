@@ -0,0 +1,202 @@
+from collections import defaultdict
+from typing import List, Tuple
+import argparse
+import json
+import math
+import os
+import time
+import numpy as np
+from algorithms import BUDGET_PARAMS, DEFAULT_PARAMS
+from presolve import Presolver
+
+DEFAULT_MODEL_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'cost_model.json')
+
+#Features used by nearest neighbour quality prediction
+FEATURES = ['log_n', 'log_T_over_mean', 'distinct_ratio', 'range_over_T']
+
+#Configurations are not chosen with budget below this fraction of the calibrated one, their quality is not predicted well
+MIN_BUDGET_FRACTION = 0.3
+
+#Configurations are not chosen for instances with more elements or distinct values than this multiple of the largest calibrated ones,
+#time model is not trusted further
+MAX_SIZE_EXTRAPOLATION = 2
+
+#Predicted times are scaled up so that this share of calibration runs finishes within prediction
+TIME_QUANTILE = 90
+
+
+def instance_features(problem: list, T: int) -> dict:
+    '''Cheap O(n) features of the instance.'''
+    n = len(problem)
+    if n == 0:
+        return {'n': 0, 'distinct': 0, 'T': T, 'log_n': 0.0, 'log_T_over_mean': 0.0, 'distinct_ratio': 1.0, 'range_over_T': 0.0}
+    mean = sum(problem) / n
+    distinct = len(set(problem))
+    return {
+        'n': n,
+        #Greedy searches are quadratic in distinct values on histograms and in elements on lists, the time model uses both
+        'distinct': distinct,
+        'T': T,
+        'log_n': math.log10(n),
+        #Approximate number of elements in a T-set
+        'log_T_over_mean': math.log10(max(1e-9, T / mean)) if mean > 0 and T > 0 else 0.0,
+        'distinct_ratio': distinct / n,
+        'range_over_T': (max(problem) - min(problem)) / T if T > 0 else 0.0
+    }
+
+
+def fit_time_model(features: List[dict], times: List[float]) -> dict:
+    '''Fit log(time) = c0 + c1 * log(n) + c2 * log(distinct) by least squares with non-negative exponents.\n
+    Return dict with coefficients and multiplicative margin that covers `TIME_QUANTILE` percent of the fitted times.'''
+    X = np.array([[1.0, math.log(max(1, f['n'])), math.log(max(1, f['distinct']))] for f in features])
+    y = np.log(np.maximum(1e-6, times))
+    #Sizes and distinct values grow together on most instances, an unconstrained fit trades a negative exponent of one for a large exponent
+    #of the other, which explodes off the calibrated instances. Negative exponents are dropped one at a time
+    active = [0, 1, 2]
+    while True:
+        coefficients = np.zeros(3)
+        coefficients[active], _, _, _ = np.linalg.lstsq(X[:, active], y, rcond=None)
+        negative = [i for i in active[1:] if coefficients[i] < 0]
+        if len(negative) == 0:
+            break
+        active.remove(min(negative, key=lambda i: coefficients[i]))
+    residuals = y - X @ coefficients
+    return {'coefficients': [float(c) for c in coefficients], 'margin': float(math.exp(max(0.0, np.percentile(residuals, TIME_QUANTILE))))}
+
+
+def calibrate(report: dict, k: int = 3) -> dict:
+    '''Fit cost model from benchmark report measured with `benchmark.py --calibration`.\n
+    For every solver configuration wall time is fitted as a power of the number of elements and of distinct values.
+    Configurations with a budget get separate models of the fixed cost (run with budget 1) and of the cost per budget unit.
+    Quality is predicted from the k nearest benchmark instances.
+    Sizes and features are those of the instance the solver ran on, the presolved core for configurations with presolve, as `choose_algorithm` sees the core.'''
+    from benchmark import CONFIGS, generate_instance
+
+    features = dict()
+    samples = defaultdict(list)
+    for entry in report['results']:
+        if entry['solver'] not in CONFIGS:
+            continue
+        config = CONFIGS[entry['solver']]
+        if BUDGET_PARAMS.get(config['algorithm']) != None and 'fixed_time' not in entry:
+            raise ValueError(f"{entry['instance']} {entry['solver']} has no fixed cost measurement, run benchmark.py with --calibration")
+        key = (entry['family'], entry['size'], entry['seed'], config['presolve'])
+        if key not in features:
+            problem, T = generate_instance(*key[:3])
+            start_time = time.perf_counter()
+            core = Presolver(T).presolve(problem) if config['presolve'] else problem
+            features[key] = (instance_features(core, T), time.perf_counter() - start_time)
+        core_features, presolve_time = features[key]
+        #Time limit of `choose_algorithm` covers the solver only, presolve time is not part of it
+        fixed_time = entry.get('fixed_time', entry['wall_time']) - presolve_time
+        samples[entry['solver']].append((core_features, entry['penalty'], fixed_time, entry['wall_time'] - presolve_time))
+
+    configs = dict()
+    for name, entries in samples.items():
+        config = CONFIGS[name]
+        budget_name = BUDGET_PARAMS.get(config['algorithm'])
+        calibrated_budget = config['params'].get(budget_name, DEFAULT_PARAMS[config['algorithm']].get(budget_name)) if budget_name != None else None
+        entry_features = [f for f, _, _, _ in entries]
+        configs[name] = {
+            'algorithm': config['algorithm'],
+            'params': config['params'],
+            'budget_name': budget_name,
+            'calibrated_budget': calibrated_budget,
+            'fixed_model': fit_time_model(entry_features, [fixed for _, _, fixed, _ in entries]),
+            'unit_model': fit_time_model(entry_features, [(wall - fixed) / calibrated_budget for _, _, fixed, wall in entries]) if budget_name != None else None,
+            'max_size': max(f['n'] for f in entry_features),
+            'max_distinct': max(f['distinct'] for f in entry_features),
+            'samples': [{'features': [f[feature] for feature in FEATURES], 'penalty': p} for f, p, _, _ in entries]
+        }
+
+    return {'features': FEATURES, 'k': k, 'configs': configs}
+
+
+def load_model(path: str = None) -> dict:
+    with open(path if path != None else DEFAULT_MODEL_PATH) as f:
+        return json.load(f)
+
+
+def model_time(model: dict, n: int, distinct: int) -> float:
+    c0, c1, c2 = model['coefficients']
+    return model['margin'] * math.exp(c0 + c1 * math.log(max(1, n)) + c2 * math.log(max(1, distinct)))
+
+
+def predict_time(config: dict, n: int, distinct: int, budget: int = 0) -> float:
+    '''Predicted wall time of configuration on n elements with `distinct` distinct values: fixed cost and `budget` units of its budget parameter'''
+    seconds = model_time(config['fixed_model'], n, distinct)
+    if config['unit_model'] != None:
+        seconds += budget * model_time(config['unit_model'], n, distinct)
+    return seconds
+
+
+def predict_penalty(config: dict, features: dict, k: int = 3) -> float:
+    '''Mean penalty of configuration on the k benchmark instances nearest to features'''
+    x = np.array([features[name] for name in FEATURES])
+    points = np.array([s['features'] for s in config['samples']])
+    scale = np.maximum(points.std(axis=0), 1e-9)
+    distances = np.linalg.norm((points - x) / scale, axis=1)
+    nearest = np.argsort(distances)[:k]
+    return float(np.mean([config['samples'][i]['penalty'] for i in nearest]))
+
+
+def choose_algorithm(problem: list, T: int, time_limit: float = 10.0, model: dict = None) -> Tuple[str, dict, dict]:
+    '''Pick solver configuration with the best predicted penalty among those predicted to finish within `time_limit` seconds.
+    Budget of iterative solvers is scaled to the time limit, up to the budget of `algorithms.DEFAULT_PARAMS`. If nothing fits, default greedy is returned and decision has 'fallback' set.\n
+    Return algorithm name, its params, decision dict with features and predictions.'''
+    model = model if model != None else load_model()
+    features = instance_features(problem, T)
+    n = features['n']
+    distinct = features['distinct']
+
+    candidates = list()
+    for name, config in model['configs'].items():
+        if n > MAX_SIZE_EXTRAPOLATION * config['max_size'] or distinct > MAX_SIZE_EXTRAPOLATION * config['max_distinct']:
+            continue
+        #GA needs at least two distinct values, `run_algorithm` hands other problems to greedy
+        if config['algorithm'] == 'genetic' and distinct <= 1:
+            continue
+        budget_name = config['budget_name']
+        params = dict(config['params'])
+        budget = None
+        if budget_name != None:
+            #Fixed cost (base solution, bounds) is paid once, only the rest of the time limit is split into budget units
+            fixed = predict_time(config, n, distinct)
+            per_unit = predict_time(config, n, distinct, 1) - fixed
+            budget = min(DEFAULT_PARAMS[config['algorithm']][budget_name], int((time_limit - fixed) / max(1e-12, per_unit)))
+            if budget < max(1, MIN_BUDGET_FRACTION * config['calibrated_budget']):
+                continue
+            params[budget_name] = budget
+
+        time = predict_time(config, n, distinct, budget if budget != None else 0)
+        if time > time_limit:
+            continue
+        candidates.append((predict_penalty(config, features, model['k']), time, name, config['algorithm'], params))
+
+    decision = {'features': features, 'time_limit': time_limit, 'candidates': {c[2]: {'penalty': c[0], 'time': c[1]} for c in candidates}}
+    if len(candidates) == 0:
+        decision['chosen'] = 'greedy (no configuration fits time limit)'
+        decision['fallback'] = True
+        return 'greedy', dict(DEFAULT_PARAMS['greedy']), decision
+
+    penalty, time, name, algorithm_name, params = min(candidates, key=lambda c: (c[0], c[1]))
+    decision.update({'chosen': name, 'predicted_penalty': penalty, 'predicted_time': time})
+    return algorithm_name, params, decision
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Calibrate cost model of automatic algorithm selection from benchmark results")
+    parser.add_argument('reports', nargs="+", help="Benchmark results files, see benchmark.py, their results are merged")
+    parser.add_argument('-o', '--output', type=str, default=DEFAULT_MODEL_PATH, help="Path to save cost model at", metavar="PATH")
+    parser.add_argument('-k', type=int, default=3, help="Number of nearest benchmark instances used to predict penalty")
+    args = parser.parse_args()
+
+    results = list()
+    for path in args.reports:
+        with open(path) as f:
+            results += json.load(f)['results']
+    model = calibrate({'results': results}, args.k)
+
+    with open(args.output, 'w') as f:
+        json.dump(model, f, indent=1)
+        print(f'Saved cost model of {len(model["configs"])} configurations to {args.output}')
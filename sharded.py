@@ -0,0 +1,156 @@
+import multiprocessing
+import os
+import random
+import sys
+import time
+from typing import List, Tuple
+from algorithms import run_algorithm
+from global_functions import calculate_penalty, make_rng, spawn_seeds
+from shared import SharedProblem, share_tracker
+
+
+def solve_shard(task: tuple) -> Tuple[List[List[int]], List[int]]:
+    '''Solve single shard in worker process. Task is (shared problem handle, shard index, shard count, T, algorithm name, params, seed).\n
+    Shard is read from shared memory as strided slice of the problem, only the handle is pickled.'''
+    handle, k, shard_count, T, algorithm_name, params, seed = task
+    shared = SharedProblem.attach(handle)
+    try:
+        shard = shared.get_strided(k, shard_count)
+    finally:
+        shared.close()
+    solution, leftovers, _ = run_algorithm(shard, T, algorithm_name, params, seed)
+    return solution, leftovers
+
+
+def profile_params(params: dict, suffix: str) -> dict:
+    '''Give a shard its own cProfile export file, concurrent workers would overwrite a single one'''
+    if params == None or params.get('profile_path') == None:
+        return params
+    root, ext = os.path.splitext(params['profile_path'])
+    return dict(params, profile_path=f'{root}_{suffix}{ext}')
+
+
+class ShardedSolver:
+    '''Map-reduce decomposition for very large problems. Shards are solved in parallel worker processes by any solver,
+    then leftovers of all shards are recombined and solved again to form further T-sets.'''
+
+    def __init__(
+            self,
+            T: int,
+            algorithm_name: str = 'grasp',
+            shard_size: int = 10000,
+            workers: int = None,
+            params: dict = None,
+            merge_algorithm: str = None,
+            merge_params: dict = None,
+            max_merge_rounds: int = 5,
+            verbose: bool = False,
+            rng: random.Random = None) -> None:
+        '''
+        Create sharded solver.
+        Params:
+            `T`: number to which all the sets should sum up
+            `algorithm_name`: solver used for shards, one of `algorithms.ALGORITHMS`
+            `shard_size`: maximal number of elements in a shard
+            `workers`: number of worker processes, by default number of CPUs
+            `params`: parameters of shard solver, see `algorithms.DEFAULT_PARAMS`
+            `merge_algorithm`: solver used to recombine leftovers, by default the shard solver
+            `merge_params`: parameters of merge solver
+            `max_merge_rounds`: maximal number of parallel merge rounds over leftovers that do not fit a single shard
+            `verbose`: flag to indicate whether there should be any debug output
+            `rng`: random number generator or seed, shard solvers get independent seeds spawned from it
+        '''
+        self.T = T
+        self.algorithm_name = algorithm_name
+        self.shard_size = shard_size
+        self.workers = workers if workers != None else multiprocessing.cpu_count()
+        self.params = params
+        self.merge_algorithm = merge_algorithm if merge_algorithm != None else algorithm_name
+        self.merge_params = merge_params if merge_algorithm != None else params
+        self.max_merge_rounds = max_merge_rounds
+        self.verbose = verbose
+        self.rng = make_rng(rng)
+        self.stats = dict()
+
+    def solve(self, problem: list) -> Tuple[List[List[int]], List[int], float]:
+        '''Solve problem by sharding.\n
+        Return: \n
+        Solution: List of solution sets\n
+        Leftovers: List of leftovers\n
+        Penalty: Quailty measure of solution'''
+        start_time = time.perf_counter()
+        self.stats = {'shards': 0, 'rounds': list()}
+
+        #Random split keeps value distribution of every shard close to the whole problem
+        pool = list(problem)
+        self.rng.shuffle(pool)
+        solution = list()
+
+        share_tracker()
+        with multiprocessing.Pool(self.workers) as workers:
+            sets, pool = self.__map(workers, pool, self.algorithm_name, self.params)
+            solution += sets
+
+            #Reduce: leftovers that span multiple shards are reshuffled and solved again while it keeps producing sets
+            for _ in range(self.max_merge_rounds):
+                if len(pool) <= self.shard_size:
+                    break
+                self.rng.shuffle(pool)
+                sets, pool = self.__map(workers, pool, self.merge_algorithm, self.merge_params)
+                solution += sets
+                if len(sets) == 0:
+                    break
+
+        #Final merge pass over all leftovers at once
+        if 0 < len(pool) <= self.shard_size:
+            sets, pool, _ = run_algorithm(pool, self.T, self.merge_algorithm, profile_params(self.merge_params, 'merge'), self.rng)
+            solution += sets
+            self.stats['rounds'].append({'shards': 1, 'sets': len(sets), 'leftovers': len(pool)})
+
+        self.stats['run_time'] = time.perf_counter() - start_time
+        penalty = calculate_penalty(self.T, solution, pool)
+        self.debug_message(f'Sharded solution: {len(solution)} sets, {len(pool)} leftovers, penalty {penalty}')
+        return solution, pool, penalty
+
+    def __map(self, workers, elements: list, algorithm_name: str, params: dict) -> Tuple[List[List[int]], List[int]]:
+        '''Split elements into equal strided shards and solve them in worker processes. Return found sets and leftovers of all shards.\n
+        With `profile_path` in params every shard exports its profile to the path suffixed with round and shard index.'''
+        shard_count = -(-len(elements) // self.shard_size)
+        round_index = len(self.stats['rounds'])
+        seeds = spawn_seeds(self.rng, shard_count)
+
+        solution = list()
+        leftovers = list()
+        with SharedProblem.create(elements, indexes=False) as shared:
+            tasks = [(shared.handle, k, shard_count, self.T, algorithm_name, profile_params(params, f'r{round_index}_s{k}'), seeds[k]) for k in range(shard_count)]
+            for sets, rest in workers.imap_unordered(solve_shard, tasks):
+                solution += sets
+                leftovers += rest
+
+        self.stats['shards'] += shard_count
+        self.stats['rounds'].append({'shards': shard_count, 'sets': len(solution), 'leftovers': len(leftovers)})
+        self.debug_message(f'Round over {shard_count} shards: {len(solution)} sets, {len(leftovers)} leftovers')
+        return solution, leftovers
+
+    def debug_message(self, message) -> None:
+        '''Print message'''
+        if self.verbose:
+            print(message, file=sys.stderr)
+
+    def get_parameters(self) -> dict:
+        return {
+            'algorithm': self.algorithm_name,
+            'merge_algorithm': self.merge_algorithm,
+            'shard_size': self.shard_size,
+            'workers': self.workers,
+            'stats': self.stats
+        }
+
+
+if __name__ == '__main__':
+    from generator import Generator
+
+    problem, _ = Generator(1).generate_planted_solution(100000, 2500)
+    sharded = ShardedSolver(2500, 'grasp', shard_size=20000, params={'RCL_count': 20, 'iterations': 20}, verbose=True, rng=1)
+    solution, leftovers, penalty = sharded.solve(problem)
+    print(f'{len(problem)} elements, {len(solution)} sets, {len(leftovers)} leftovers, penalty {penalty}, {sharded.stats["run_time"]:.1f}s')
@@ -0,0 +1,117 @@
+from collections import Counter
+from multiprocessing import resource_tracker, shared_memory
+from typing import Dict, List, Tuple
+import numpy as np
+
+
+class SharedProblem:
+    '''Problem array and its read-only indexes (sorted order, value histogram, reachable sums) in shared memory.\n
+    Parent process creates it once, worker processes attach to the blocks by name through the picklable `handle`,
+    so the problem is not pickled and sent to every worker.'''
+
+    def __init__(self, handle: Dict[str, Tuple[str, int, str]], owner: bool) -> None:
+        '''Attach to blocks described by handle, use `create` or `attach` instead.'''
+        self.handle = handle
+        self.owner = owner
+        self.blocks = dict()
+        self.arrays = dict()
+        for key, (name, length, dtype) in handle.items():
+            block = shared_memory.SharedMemory(name=name)
+            self.blocks[key] = block
+            self.arrays[key] = np.ndarray((length,), dtype=np.dtype(dtype), buffer=block.buf)
+
+    @staticmethod
+    def create(problem: list, sorted_problem: list = None, histogram: Counter = None, reach: int = None, indexes: bool = True) -> 'SharedProblem':
+        '''
+        Copy problem and its indexes into new shared memory blocks.
+        Params:
+            `problem`: problem set
+            `sorted_problem`: problem sorted descending, computed if not provided
+            `histogram`: value -> count histogram of the problem, computed if not provided
+            `reach`: optional `bounds.reachable_sums` bitset of the problem
+            `indexes`: flag to indicate whether sorted problem and histogram should be stored
+        '''
+        arrays = {'problem': np.asarray(problem, dtype=np.int64)}
+        if indexes:
+            if sorted_problem == None:
+                sorted_problem = sorted(problem, reverse=True)
+            if histogram == None:
+                histogram = Counter(problem)
+            arrays['sorted'] = np.asarray(sorted_problem, dtype=np.int64)
+            arrays['values'] = np.fromiter(histogram.keys(), dtype=np.int64, count=len(histogram))
+            arrays['counts'] = np.fromiter(histogram.values(), dtype=np.int64, count=len(histogram))
+        if reach != None:
+            arrays['reach'] = np.frombuffer(reach.to_bytes(max(1, (reach.bit_length() + 7) // 8), 'little'), dtype=np.uint8)
+
+        handle = dict()
+        try:
+            for key, array in arrays.items():
+                #Zero sized blocks are not allowed
+                block = shared_memory.SharedMemory(create=True, size=max(1, array.nbytes))
+                np.ndarray(array.shape, dtype=array.dtype, buffer=block.buf)[:] = array
+                handle[key] = (block.name, len(array), array.dtype.str)
+                block.close()
+        except BaseException:
+            SharedProblem.__unlink_names([name for name, _, _ in handle.values()])
+            raise
+
+        return SharedProblem(handle, owner=True)
+
+    @staticmethod
+    def attach(handle: Dict[str, Tuple[str, int, str]]) -> 'SharedProblem':
+        '''Attach to blocks created by another process.'''
+        return SharedProblem(handle, owner=False)
+
+    @staticmethod
+    def __unlink_names(names: List[str]) -> None:
+        for name in names:
+            block = shared_memory.SharedMemory(name=name)
+            block.close()
+            block.unlink()
+
+    def get_problem(self) -> List[int]:
+        return self.arrays['problem'].tolist()
+
+    def get_sorted(self) -> List[int]:
+        return self.arrays['sorted'].tolist()
+
+    def get_histogram(self) -> Counter:
+        return Counter(dict(zip(self.arrays['values'].tolist(), self.arrays['counts'].tolist())))
+
+    def get_reach(self) -> int:
+        '''Return stored reachable sums bitset, None if it was not stored'''
+        if 'reach' not in self.arrays:
+            return None
+        return int.from_bytes(self.arrays['reach'].tobytes(), 'little')
+
+    def get_strided(self, start: int, step: int) -> List[int]:
+        '''Return problem elements start, start + step, ... without copying the rest of the problem'''
+        return self.arrays['problem'][start::step].tolist()
+
+    def close(self) -> None:
+        '''Detach from blocks, owner also frees them'''
+        self.arrays = dict()
+        for block in self.blocks.values():
+            block.close()
+            if self.owner:
+                block.unlink()
+        self.blocks = dict()
+
+    def __enter__(self) -> 'SharedProblem':
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+
+def share_tracker() -> None:
+    '''Start shared memory tracker of this process. Call it before creating worker pool, forked workers then share the tracker
+    instead of starting their own, which would report (and unlink) blocks they attached to as leaked when they exit.'''
+    resource_tracker.ensure_running()
+
+
+if __name__ == '__main__':
+    with SharedProblem.create([5, 1, 9, 1, 3], reach=0b1011) as shared:
+        attached = SharedProblem.attach(shared.handle)
+        print(attached.get_problem(), attached.get_sorted(), attached.get_histogram(), bin(attached.get_reach()), attached.get_strided(0, 2))
+        attached.close()
@@ -1,74 +1,358 @@
 from greedy_solver import GreedySolver
-from GRASP import GRASP
-from genetic_solver import GeneticSolver
-import sys 
+from presolve import Presolver
+from algorithms import ALGORITHMS, run_algorithm, use_histogram
+from sharded import ShardedSolver
+from global_functions import make_rng, spawn_seeds
+from bounds import lower_bound_leftovers, optimality_gap, reachable_sums
+from results import OUTPUT_FORMATS, read_results, write_results
+from shared import SharedProblem
+from selector import choose_algorithm
+from collections import Counter
+from typing import List, Tuple
+import argparse
+import multiprocessing
+import random
 import json
+import sys
+import time
 
 
-try:
-    json_name = sys.argv[1]
+def solve_problem(problem: list, T: int, algorithm_name: str, presolve: bool = True, params: dict = None, rng: random.Random = None, early_stop: bool = True, shard_size: int = 0, workers: int = None, histogram: Counter = None, reach: int = None, time_limit: float = 10.0, presolve_pairs: bool = False) -> Tuple[dict, dict]:
+    '''Solve single problem with chosen algorithm, optionally reducing it with presolve first.
+    With `presolve_pairs` presolve also emits complementary pairs, a heuristic that can make the optimum unreachable, see `Presolver`.
+    `histogram` and `reach` are optional precomputed value counts and `reachable_sums` of the problem, see `BatchSolver`. `reach` also serves the bounds of the early stop and of the solver.\n
+    With `early_stop` a cheap greedy solution of the core is tried first and the chosen algorithm is skipped if it meets the lower bound on leftovers.
+    Early stops are disabled when presolve committed complementary pairs, the optimum of such core can be worse than the optimum of the problem.\n
+    With `shard_size` > 0 cores larger than it are solved by `ShardedSolver` in `workers` processes.\n
+    Algorithm 'auto' picks solver and its budget for the core by `selector.choose_algorithm` within `time_limit` seconds, time spent on presolve and the early stop check counts towards it.
+    The decision is logged under 'auto' key of parameters.\n
+    Return result dict, parameters dict.'''
+    start_time = time.perf_counter()
+    presolver = Presolver(T, pairs=presolve_pairs)
+    core = presolver.presolve(problem, histogram) if presolve else list(problem)
+    sharded = shard_size > 0 and len(core) > shard_size
+    #Bounds of the core hold for the original problem only if presolve made exact reductions
+    early_stop = early_stop and (not presolve or presolver.is_exact())
 
+    solution = None
+    precheck = None
+    if early_stop and not sharded and 'greedy' not in algorithm_name.lower() and len(core) > 0:
+        if use_histogram(core):
+            greedy_solution, greedy_leftovers, _ = GreedySolver(verbose=False).greedy_histogram_solution(Counter(core), T)
+        else:
+            greedy_solution, greedy_leftovers, _ = GreedySolver(verbose=False).greedy_solution(core, T)
+        if len(greedy_leftovers) <= lower_bound_leftovers(core, T, reach=reach):
+            solution, leftovers, params = greedy_solution, greedy_leftovers, {'early_stop': 'greedy solution meets lower bound'}
+        precheck = (greedy_solution, greedy_leftovers)
+
+    decision = None
+    if solution == None:
+        if algorithm_name == 'auto':
+            #Sharded cores are solved shard by shard, the choice is made for shard sized part
+            elapsed = time.perf_counter() - start_time
+            algorithm_name, chosen_params, decision = choose_algorithm(core[:shard_size] if sharded else core, T, time_limit - elapsed)
+            decision['elapsed'] = elapsed
+            params = dict(chosen_params, **(params if params != None else dict()))
+
+        if 'greedy' not in algorithm_name.lower():
+            params = dict(params) if params != None else dict()
+            params['early_stop'] = early_stop
+
+        if decision != None and decision.get('fallback') and precheck != None:
+            #Fallback is the default greedy, the same search as the early stop check, its solution is reused instead of running it again
+            solution, leftovers = precheck
+        elif sharded:
+            sharded_solver = ShardedSolver(T, algorithm_name, shard_size=shard_size, workers=workers, params=params, rng=rng)
+            solution, leftovers, _ = sharded_solver.solve(core)
+            params = sharded_solver.get_parameters()
+        else:
+            solution, leftovers, params = run_algorithm(core, T, algorithm_name, params, rng, reach)
+
+    params = dict(params)
+    if decision != None:
+        params['auto'] = decision
+    if presolve:
+        solution, leftovers, _ = presolver.merge(solution, leftovers)
+        params['presolve'] = presolver.get_reduction_stats(len(problem))
+
+    lower_bound = lower_bound_leftovers(problem, T, reach=reach)
+    params['lower_bound'] = lower_bound
+    params['optimality_gap'] = optimality_gap(len(leftovers), lower_bound, len(problem))
+
+    result = {
+        'problem': list(problem),
+        'T': T,
+        'solution': solution,
+        'leftovers': leftovers
+    }
+    return result, params
+
+
+def reuse_solution(problem: list, T: int, solution: List[List[int]]) -> Tuple[List[List[int]], List[int]]:
+    '''Keep sets of a previous solution that still sum to T and whose elements are all still present in the problem.\n
+    Return kept sets, remaining elements of the problem.'''
+    available = Counter(problem)
+    kept = list()
+    for s in solution:
+        needed = Counter(s)
+        if sum(s) == T and len(s) > 0 and all(available[el] >= cnt for el, cnt in needed.items()):
+            available.subtract(needed)
+            kept.append(list(s))
+
+    free = list()
+    for el in problem:
+        if available[el] > 0:
+            free.append(el)
+            available[el] -= 1
+    return kept, free
+
+
+def solve_warm(problem: list, T: int, algorithm_name: str, previous: dict, presolve: bool = True, params: dict = None, rng: random.Random = None, early_stop: bool = True, time_limit: float = 10.0, presolve_pairs: bool = False, shard_size: int = 0, workers: int = None) -> Tuple[dict, dict]:
+    '''Re-solve problem starting from previous result dict of the same (possibly slightly changed) problem.
+    Still valid T-sets are kept, only freed elements, previous leftovers and new elements are solved by chosen algorithm.
+    Previous sets are only candidates, e.g. sets of a 'stale' result decoded by position, sets that are no longer T-sets of the problem are dropped.
+    Reuse statistics and whether the previous result was stale are reported under 'warm_start' key of parameters.
+    Other params see `solve_problem`.\n
+    Return result dict, parameters dict.'''
+    if previous == None or previous['T'] != T:
+        return solve_problem(problem, T, algorithm_name, presolve=presolve, params=params, rng=rng, early_stop=early_stop, time_limit=time_limit, presolve_pairs=presolve_pairs, shard_size=shard_size, workers=workers)
+
+    kept, free = reuse_solution(problem, T, previous['solution'])
+    result, params = solve_problem(free, T, algorithm_name, presolve=presolve, params=params, rng=rng, early_stop=early_stop, time_limit=time_limit, presolve_pairs=presolve_pairs, shard_size=shard_size, workers=workers)
+
+    solution = kept + result['solution']
+    leftovers = result['leftovers']
+    #Stale result was decoded by position against a changed problem, few of its sets usually survive
+    params['warm_start'] = {'kept_sets': len(kept), 'previous_sets': len(previous['solution']), 'resolved_elements': len(free), 'stale': previous.get('stale', False)}
+    lower_bound = lower_bound_leftovers(problem, T)
+    params['lower_bound'] = lower_bound
+    params['optimality_gap'] = optimality_gap(len(leftovers), lower_bound, len(problem))
+
+    result = {
+        'problem': list(problem),
+        'T': T,
+        'solution': solution,
+        'leftovers': leftovers
+    }
+    return result, params
+
+
+class BatchSolver:
+    '''Solve one problem set for many T values. Sorted problem, value histogram and reachable sums are computed once and shared by all T values.'''
+
+    def __init__(self, problem: list, algorithm_name: str, presolve: bool = True, params: dict = None, early_stop: bool = True, workers: int = 1, rng: random.Random = None, shared: SharedProblem = None, time_limit: float = 10.0, presolve_pairs: bool = False) -> None:
+        '''
+        Create batch solver.
+        Params:
+            `problem`: problem set shared by all T values, ignored if `shared` is provided
+            `algorithm_name`: solver used for every T, one of `algorithms.ALGORITHMS`
+            `presolve`, `params`, `early_stop`, `time_limit`, `presolve_pairs`: see `solve_problem`
+            `workers`: number of worker processes solving different T values in parallel
+            `rng`: random number generator or seed, every T gets independent seed spawned from it
+            `shared`: problem with precomputed indexes in shared memory, used by worker processes
+        '''
+        self.algorithm_name = algorithm_name
+        self.presolve = presolve
+        self.presolve_pairs = presolve_pairs
+        self.params = params
+        self.early_stop = early_stop
+        self.time_limit = time_limit
+        self.workers = workers
+        self.rng = make_rng(rng)
+
+        if shared != None:
+            #Workers keep only what solvers need, the parent fills the problem into results
+            self.problem = None
+            self.sorted_problem = shared.get_sorted()
+            self.histogram = shared.get_histogram()
+            self.reach = shared.get_reach()
+            #Bound of the stored bitset is not known from the bitset itself, reach is unused until the owner sets it
+            self.reach_bound = 0
+            return
+
+        #Solvers receive presorted problem, so their own sorting is linear
+        self.problem = list(problem)
+        self.sorted_problem = sorted(self.problem, reverse=True)
+        self.histogram = Counter(self.problem)
+        self.reach = None
+        self.reach_bound = 0
+
+    def prepare(self, targets: list) -> None:
+        '''Compute reachable sums once, up to the largest T'''
+        bound = max(targets)
+        if bound > self.reach_bound and min(self.problem, default=0) >= 0:
+            self.reach = reachable_sums(self.problem, bound)
+            self.reach_bound = bound
+
+    def solve_target(self, T: int, seed: int) -> Tuple[dict, dict]:
+        '''Solve problem for single T. Result has no 'problem', `solve` fills it in, so workers do not send the problem back with every result'''
+        reach = self.reach if T <= self.reach_bound and T > 0 else None
+        result, params = solve_problem(self.sorted_problem, T, self.algorithm_name, presolve=self.presolve, params=self.params, rng=seed, early_stop=self.early_stop, histogram=self.histogram, reach=reach, time_limit=self.time_limit, presolve_pairs=self.presolve_pairs)
+        del result['problem']
+        return result, params
+
+    def solve(self, targets: list) -> List[Tuple[dict, dict]]:
+        '''Solve problem for every T in `targets`.\n
+        Return list of (result dict, parameters dict) in order of `targets`.'''
+        if len(targets) == 0:
+            return list()
+
+        self.prepare(targets)
+        seeds = spawn_seeds(self.rng, len(targets))
+
+        if self.workers <= 1 or len(targets) == 1:
+            solved = [self.solve_target(T, seed) for T, seed in zip(targets, seeds)]
+        else:
+            #Workers attach to the problem and its precomputation in shared memory, tasks carry only T and seed
+            settings = (self.algorithm_name, self.presolve, self.presolve_pairs, self.params, self.early_stop, self.time_limit, self.reach_bound)
+            with SharedProblem.create(self.problem, self.sorted_problem, self.histogram, self.reach) as shared:
+                with multiprocessing.Pool(self.workers, initializer=_init_batch_worker, initargs=(shared.handle, settings)) as pool:
+                    solved = pool.map(_solve_batch_target, list(zip(targets, seeds)))
+
+        for result, _ in solved:
+            result['problem'] = self.problem
+        return solved
+
+
+_batch_solver = None
+
+def _init_batch_worker(handle: dict, settings: tuple) -> None:
+    global _batch_solver
+    algorithm_name, presolve, presolve_pairs, params, early_stop, time_limit, reach_bound = settings
+    shared = SharedProblem.attach(handle)
+    _batch_solver = BatchSolver(None, algorithm_name, presolve=presolve, params=params, early_stop=early_stop, shared=shared, time_limit=time_limit, presolve_pairs=presolve_pairs)
+    _batch_solver.reach_bound = reach_bound
+    shared.close()
+
+def _solve_batch_target(task: tuple) -> Tuple[dict, dict]:
+    return _batch_solver.solve_target(*task)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('json_name', help="Json source file name like: test or test.json")
+    parser.add_argument('algorithm_name', choices=ALGORITHMS + ['auto'], help="Algorithm used to solve problems, 'auto' picks it from instance features by cost model calibrated on benchmark")
+    parser.add_argument('--no-presolve',
+        action="store_false",
+        dest="presolve",
+        help="Hand the raw problem to the solver without presolve reduction"
+    )
+    parser.add_argument('--presolve-pairs',
+        action="store_true",
+        dest="presolve_pairs",
+        help="Let presolve also commit complementary pairs x + (T - x). Heuristic, it can make the optimum unreachable"
+    )
+    parser.add_argument('--seed', type=int, default=None, help="Seed of the solver random number generator")
+    parser.add_argument('--no-early-stop',
+        action="store_false",
+        dest="early_stop",
+        help="Run the full search budget even after reaching the lower bound on leftovers"
+    )
+    parser.add_argument('--shard-size',
+        type=int,
+        default=0,
+        dest="shard_size",
+        help="Split problems larger than SIZE into shards solved in parallel worker processes. 0 disables sharding",
+        metavar="SIZE"
+    )
+    parser.add_argument('--workers', type=int, default=None, help="Number of worker processes used by sharding or batch solving")
+    parser.add_argument('--batch',
+        action="store_true",
+        help="Solve problems sharing the same set S together, reusing its sorted form, histogram and reachable sums for every T"
+    )
+    parser.add_argument('--output-format',
+        choices=OUTPUT_FORMATS,
+        default='full',
+        dest="output_format",
+        help="'full' echoes problems and writes value lists, 'index' writes membership vectors to json, 'npz' to compressed numpy archive. Compact results are read back by results.py"
+    )
+    parser.add_argument('--time-limit',
+        type=float,
+        default=10.0,
+        dest="time_limit",
+        help="Time limit in seconds per problem used by 'auto' algorithm to choose solver and its budget"
+    )
+    parser.add_argument('--warm-start',
+        type=str,
+        default=None,
+        dest="warm_start",
+        help="Results file of a previous run (any output format). Still valid T-sets of the result at the same position are kept and only the rest is solved",
+        metavar="RESULTS"
+    )
+    parser.add_argument('--profile',
+        type=str,
+        default=None,
+        help="Dump cProfile stats of GRASP and genetic runs to PREFIX_<problem index>.prof",
+        metavar="PREFIX"
+    )
+    args = parser.parse_args()
+    if args.batch and args.warm_start != None:
+        parser.error('--warm-start cannot be combined with --batch')
+
+    json_name = args.json_name
     if '.json' not in json_name:
         json_name += '.json'
-except:
-    print(f'You should provide json source file name like: test or test.json')
-    exit(0)
-
-try:
-    algorithm_name = sys.argv[2]
-except:
-    print(f'You should provide algorithm name ["genetic", "grasp", "greedy"]')
-    exit(0)
-
-
-print(f'Json file: {json_name}')
-print(f'Algorithm chosen: {algorithm_name}')
-
-with open(json_name) as f:
-    dic = json.load(f)
-    print(dic)
-    artifacts = {
-        'results': list(), 
-        'parameters': {}
-        }
-
-    for element in dic['problems']:
-        problem = element['S']
-        sumT = element['T']
-
-        print(f'Problem{problem}\nSum to {sumT}')
-
-        if 'grasp' in algorithm_name.lower():
-            algorithm = GRASP(problem=problem, 
-                T=sumT,
-                dropout_rate=0.8,
-                RCL_count=200,
-                dropout_size=0.4,
-                bootsrap_iters=10,
-                iterations=100
-                )
-            algorithm.perform_GRASP()
-            result = algorithm.get_result_dict()
-            params = algorithm.get_parameters()
-        elif 'genetic' in algorithm_name.lower():
-            algorithm = GeneticSolver(
-                problem,
-                T=sumT,
-                silent=True
-            )
-            algorithm.run(300000)
-            result = algorithm.get_result_dict()
-            params = algorithm.get_parameters()
-        else:
-            algorithm = GreedySolver()
-            algorithm.greedy_solution(start_set=problem, T=sumT)
-            
-
-        artifacts['results'].append(result)
-    
-    artifacts['parameters'] = params
-
-    with open(json_name[:-4] + '_results.json', 'w') as fwr: 
-        json.dump(artifacts, fwr)
-        print('Saved')
-        
+
+    print(f'Json file: {json_name}')
+    print(f'Algorithm chosen: {args.algorithm_name}')
+
+    with open(json_name) as f:
+        dic = json.load(f)
+        print(dic)
+        artifacts = {
+            'results': list(),
+            'parameters': {}
+            }
+
+        previous_results = list()
+        if args.warm_start != None:
+            #Compact results are decoded against the problems file they were written for. If it changed since (e.g. edited in place),
+            #memberships are applied by position and solve_warm keeps only sets that are still T-sets
+            try:
+                try:
+                    previous_results, _ = read_results(args.warm_start, strict=False)
+                except (ValueError, FileNotFoundError):
+                    #Recorded problems file is gone or unknown, decode against the current problems
+                    previous_results, _ = read_results(args.warm_start, [element['S'] for element in dic['problems']], strict=False)
+            except (ValueError, FileNotFoundError) as e:
+                parser.error(f'cannot read previous results {args.warm_start}: {e}')
+
+        rng = make_rng(args.seed)
+        if args.batch:
+            #Group problems by their set, results keep order of the source file
+            groups = dict()
+            for i, element in enumerate(dic['problems']):
+                groups.setdefault(tuple(element['S']), list()).append(i)
+
+            results = [None] * len(dic['problems'])
+            for problem, indexes in groups.items():
+                targets = [dic['problems'][i]['T'] for i in indexes]
+                print(f'Problem{list(problem)}\nSum to {targets}')
+
+                batch = BatchSolver(list(problem), args.algorithm_name, presolve=args.presolve, early_stop=args.early_stop, workers=args.workers or 1, rng=rng, time_limit=args.time_limit, presolve_pairs=args.presolve_pairs)
+                for i, (result, params) in zip(indexes, batch.solve(targets)):
+                    results[i] = result
+            artifacts['results'] = results
+
+        for i, element in enumerate(dic['problems'] if not args.batch else []):
+            problem = element['S']
+            sumT = element['T']
+
+            print(f'Problem{problem}\nSum to {sumT}')
+
+            solver_params = {'profile_path': f'{args.profile}_{i}.prof'} if args.profile != None and args.algorithm_name != 'greedy' else None
+            if args.warm_start != None:
+                previous = previous_results[i] if i < len(previous_results) else None
+                result, params = solve_warm(problem, sumT, args.algorithm_name, previous, presolve=args.presolve, params=solver_params, rng=rng, early_stop=args.early_stop, time_limit=args.time_limit, presolve_pairs=args.presolve_pairs, shard_size=args.shard_size, workers=args.workers)
+                warm_start = params.get('warm_start')
+                if warm_start != None and warm_start['stale']:
+                    print(f"Warning: problem {i} changed since {args.warm_start} was written, its previous result was matched by position and {warm_start['kept_sets']} of {warm_start['previous_sets']} sets were kept", file=sys.stderr)
+            else:
+                result, params = solve_problem(problem, sumT, args.algorithm_name, presolve=args.presolve, params=solver_params, rng=rng, early_stop=args.early_stop, shard_size=args.shard_size, workers=args.workers, time_limit=args.time_limit, presolve_pairs=args.presolve_pairs)
+            artifacts['results'].append(result)
+
+        artifacts['parameters'] = params
+
+    output_name = json_name[:-5] + ('_results.npz' if args.output_format == 'npz' else '_results.json')
+    write_results(output_name, artifacts['results'], artifacts['parameters'], args.output_format, source=json_name)
+    print('Saved')
@@ -0,0 +1,196 @@
+from contextlib import ExitStack
+from itertools import product
+from typing import List, Tuple
+from datetime import datetime
+import argparse
+import json
+import math
+import multiprocessing
+import random
+import sys
+import time
+from benchmark import FAMILIES, generate_instance
+from global_functions import calculate_penalty, make_rng
+from solve import solve_problem
+from shared import SharedProblem, share_tracker
+
+#Searched values of every tunable parameter
+SPACES = {
+    'annealing': {
+        'start_temperature': [0.1, 0.5, 2.0],
+        'end_temperature': [0.001, 0.01],
+        'swap_rate': [0.1, 0.3, 0.5],
+        'deviation_weight': [2.0, 8.0, 32.0],
+        'tabu_tenure': [0, 5]
+    },
+    'genetic': {
+        'pop_size': [50, 100, 200],
+        'mating_ratio': [0.3, 0.5, 0.7],
+        'elitism_ratio': [0.05, 0.1, 0.2],
+        'mutation_rate': [0.001, 0.01, 0.05],
+        'swap_mutation_rate': [0.001, 0.01, 0.05],
+        'leftover_weight': [0.001, 0.01, 0.1],
+        'patience': [20, 50, 100],
+        'crossover': ['uniform', 'group']
+    },
+    'grasp': {
+        'RCL_count': [20, 50, 200],
+        'dropout_rate': [0.2, 0.5, 0.8],
+        'candidate_k': [0, 2, 4],
+        'reactive': [False, True]
+    }
+}
+
+#Budget parameter of every algorithm and its value in the first rung of successive halving
+BUDGETS = {
+    'annealing': ('moves', 20000),
+    'genetic': ('generations', 50),
+    'grasp': ('iterations', 5)
+}
+
+
+def grid_configurations(space: dict) -> List[dict]:
+    '''Return every combination of parameter values.'''
+    names = list(space)
+    return [dict(zip(names, values)) for values in product(*[space[name] for name in names])]
+
+
+def random_configurations(space: dict, n: int, rng: random.Random = None) -> List[dict]:
+    '''Return up to n distinct randomly drawn combinations of parameter values.'''
+    rng = make_rng(rng)
+    total = math.prod([len(values) for values in space.values()])
+    configs = dict()
+    while len(configs) < min(n, total):
+        config = {name: rng.choice(values) for name, values in space.items()}
+        configs[json.dumps(config, sort_keys=True)] = config
+    return list(configs.values())
+
+
+def evaluate(task: tuple) -> Tuple[int, float, float]:
+    '''Run one configuration on one instance in worker process. Task is (config id, algorithm name, params, shared problem handle, T, seed, presolve).\n
+    Instances are generated once by the parent and read from shared memory. Return config id, penalty, wall time.'''
+    config_id, algorithm_name, params, handle, T, seed, presolve = task
+    shared = SharedProblem.attach(handle)
+    try:
+        problem = shared.get_problem()
+    finally:
+        shared.close()
+
+    start_time = time.perf_counter()
+    #Every configuration gets the same seed on a given instance, so they are compared on equal terms
+    result, _ = solve_problem(problem, T, algorithm_name, presolve=presolve, params=params, rng=seed)
+    wall_time = time.perf_counter() - start_time
+    return config_id, calculate_penalty(T, result['solution'], result['leftovers']), wall_time
+
+
+def successive_halving(
+        algorithm_name: str,
+        configs: List[dict],
+        instances: List[Tuple[str, int, int]],
+        min_budget: int = None,
+        max_budget: int = None,
+        eta: int = 3,
+        presolve: bool = True,
+        workers: int = None) -> List[dict]:
+    '''
+    Evaluate configurations on all instances with growing budget, after every rung only the best 1/`eta` of them advance.
+    Params:
+        `algorithm_name`: tuned algorithm, one of `SPACES`
+        `configs`: parameter dicts to compare
+        `instances`: (family, size, seed) tuples, see `benchmark.generate_instance`
+        `min_budget`: budget of the first rung, by default from `BUDGETS`
+        `max_budget`: budget at which halving stops, by default enough rungs to leave a single configuration
+        `eta`: reduction factor, budget grows and the number of configurations shrinks by it every rung
+        `presolve`: flag to indicate whether problems should be presolved
+        `workers`: number of worker processes, by default number of CPUs
+    Return ranked table of configurations, best first.
+    '''
+    budget_name, default_budget = BUDGETS[algorithm_name]
+    budget = min_budget if min_budget != None else default_budget
+    if max_budget == None:
+        max_budget = budget * eta ** max(0, math.ceil(math.log(max(1, len(configs)), eta)))
+
+    table = [{'config': config, 'rung': 0, 'budget': 0, 'penalty': None, 'time': None} for config in configs]
+    alive = list(range(len(configs)))
+    rung = 0
+
+    share_tracker()
+    with ExitStack() as stack, multiprocessing.Pool(workers) as pool:
+        shared_instances = list()
+        for family, size, seed in instances:
+            problem, T = generate_instance(family, size, seed)
+            shared_instances.append((stack.enter_context(SharedProblem.create(problem, indexes=False)).handle, T, seed))
+
+        while len(alive) > 0 and budget <= max_budget:
+            tasks = [(i, algorithm_name, dict(configs[i], **{budget_name: budget}), handle, T, seed, presolve) for i in alive for handle, T, seed in shared_instances]
+            penalties = {i: list() for i in alive}
+            times = {i: list() for i in alive}
+            for i, penalty, wall_time in pool.imap_unordered(evaluate, tasks):
+                penalties[i].append(penalty)
+                times[i].append(wall_time)
+
+            for i in alive:
+                table[i].update({
+                    'rung': rung,
+                    'budget': budget,
+                    'penalty': sum(penalties[i]) / len(penalties[i]),
+                    'time': sum(times[i]) / len(times[i])
+                })
+
+            alive.sort(key=lambda i: (table[i]['penalty'], table[i]['time']))
+            print(f'Rung {rung}: {len(alive)} configurations, {budget_name}={budget}, best penalty {table[alive[0]]["penalty"]:.4f}', file=sys.stderr)
+            if len(alive) == 1:
+                break
+            alive = alive[:max(1, len(alive) // eta)]
+            budget *= eta
+            rung += 1
+
+    #Configurations that survived longer were measured with larger budget, they rank first
+    return sorted(table, key=lambda entry: (-entry['rung'], entry['penalty'], entry['time']))
+
+
+def print_table(table: List[dict], limit: int = 20) -> None:
+    '''Print ranked configurations with quality and time'''
+    for place, entry in enumerate(table[:limit], 1):
+        print(f"{place:>3}. rung {entry['rung']} budget {entry['budget']:>8} penalty {entry['penalty']:.4f} time {entry['time']:8.3f}s {entry['config']}")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('algorithm_name', choices=list(SPACES.keys()), help="Algorithm to tune")
+    parser.add_argument('--mode', choices=['grid', 'random'], default='random', help="Grid of all parameter combinations or random sample of them")
+    parser.add_argument('--samples', type=int, default=27, help="Number of configurations drawn in random mode")
+    parser.add_argument('--families', nargs="+", default=FAMILIES, choices=FAMILIES, help="Instance families to tune on")
+    parser.add_argument('--sizes', nargs="+", type=int, default=[100, 1000], help="Instance sizes to tune on")
+    parser.add_argument('--seeds', nargs="+", type=int, default=[1, 2], help="Instance seeds to tune on")
+    parser.add_argument('--min-budget', type=int, default=None, dest="min_budget", help="Budget of the first rung (iterations, generations or moves)")
+    parser.add_argument('--max-budget', type=int, default=None, dest="max_budget", help="Budget at which halving stops")
+    parser.add_argument('--eta', type=int, default=3, help="Reduction factor of successive halving")
+    parser.add_argument('--no-presolve', action="store_false", dest="presolve", help="Hand raw problems to the solver")
+    parser.add_argument('--workers', type=int, default=None, help="Number of worker processes")
+    parser.add_argument('--seed', type=int, default=None, help="Seed of random configuration sampling")
+    parser.add_argument('-o', '--output', type=str, default='sweep_results.json', help="Path to save ranked table at", metavar="PATH")
+    args = parser.parse_args()
+
+    space = SPACES[args.algorithm_name]
+    configs = grid_configurations(space) if args.mode == 'grid' else random_configurations(space, args.samples, args.seed)
+    instances = [(family, size, seed) for family in args.families for size in args.sizes for seed in args.seeds]
+    print(f'Tuning {args.algorithm_name}: {len(configs)} configurations on {len(instances)} instances', file=sys.stderr)
+
+    start_time = time.perf_counter()
+    table = successive_halving(args.algorithm_name, configs, instances, args.min_budget, args.max_budget, args.eta, args.presolve, args.workers)
+    print_table(table)
+
+    with open(args.output, 'w') as f:
+        json.dump({
+            'meta': {
+                'date': datetime.now().strftime("%Y-%m-%d_%H-%M-%S"),
+                'algorithm': args.algorithm_name,
+                'mode': args.mode,
+                'instances': instances,
+                'eta': args.eta,
+                'run_time': time.perf_counter() - start_time
+            },
+            'table': table
+        }, f, indent=1)
+        print(f'Saved {len(table)} configurations to {args.output}')